@@ -112,6 +112,8 @@ class ArmorEditor(ArmorEditorWidgetBase, ArmorEditorWidget):
 
 
 class ArmorEntryNode(TreeNode):
+    __slots__ = ("ref",)
+
     def __init__(self, ref, parent, row):
         super().__init__(parent, row)
         self.ref = ref
@@ -126,6 +128,8 @@ class ArmorEntryNode(TreeNode):
 
 
 class ArmorSetNode(TreeNode):
+    __slots__ = ("ref",)
+
     def __init__(self, ref, parent, row, children):
         super().__init__(parent, row)
         self.ref = ref
@@ -16,6 +16,8 @@ log = logging.getLogger()
 
 
 class CraftingRequirementGroupNode(TreeNode):
+    __slots__ = ("ref",)
+
     def __init__(self, ref, parent, row, children):
         super().__init__(parent, row)
         self.ref = ref
@@ -27,6 +29,8 @@ class CraftingRequirementGroupNode(TreeNode):
 
 
 class CraftingRequirementEntryNode(TreeNode):
+    __slots__ = ("ref", "prefix")
+
     def __init__(self, ref, prefix, parent, row):
         super().__init__(parent, row)
         self.ref = ref
@@ -94,7 +98,6 @@ class CraftingRequirementsEditor(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         self.model = None
         self.equip_type = None
-        self._map_equip_id_to_index = {}
         self.item_model = StructTableModel(EqCrtEntry.fields(), self)
         self.item_mapper = QDataWidgetMapper(self)
         self.item_mapper.setItemDelegate(ItemDelegate())
@@ -108,9 +111,14 @@ class CraftingRequirementsEditor(QWidget):
         self.layout().setRowStretch(4, 1)
 
     def set_current(self, equip_id):
-        if equip_id in self._map_equip_id_to_index:
+        # the last entry of the equip_id wins, equip_type 0 matches any
+        if self.equip_type:
+            index = self.item_model.index_of_last(
+                equip_type=self.equip_type, equip_id=equip_id)
+        else:
+            index = self.item_model.index_of_last(equip_id=equip_id)
+        if index is not None:
             self.setDisabled(False)
-            index = self._map_equip_id_to_index[equip_id]
             self.item_mapper.setCurrentIndex(index)
         else:
             self.setDisabled(True)
@@ -140,11 +148,6 @@ class CraftingRequirementsEditor(QWidget):
         t9n_item_model = model.get_relation_data("t9n_item")
         if crafting_model:
             self.item_model.update(crafting_model.entries)
-            self._map_equip_id_to_index = {
-                entry.equip_id: index
-                for index, entry in enumerate(crafting_model.entries)
-                if not equip_type or equip_type == entry.equip_type
-            }
         if t9n_item_model:
             self.t9n_item_model.update(t9n_item_model)
 
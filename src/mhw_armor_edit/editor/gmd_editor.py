@@ -29,11 +29,25 @@ class GmdTableModel(QAbstractTableModel):
                 return None
 
     def data(self, qindex: QModelIndex, role=None):
-        if role == Qt.DisplayRole:
+        if role == Qt.DisplayRole or role == Qt.EditRole:
             item = self.model.items[qindex.row()]
             attr = self.columns[qindex.column()]
             return getattr(item, attr)
 
+    def flags(self, qindex):
+        flags = super().flags(qindex)
+        if self.columns[qindex.column()] == "value":
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, qindex, value, role=None):
+        if role != Qt.EditRole or self.columns[qindex.column()] != "value":
+            return False
+        item = self.model.items[qindex.row()]
+        self.model.set_string(item.string_index, value)
+        self.dataChanged.emit(qindex, qindex)
+        return True
+
     def update(self, model):
         self.beginResetModel()
         self.model = model
@@ -55,6 +69,15 @@ class GmdTableEditor(QWidget):
         self.model = model
         self.table_model.update(model.data)
 
+    def select_string(self, string_index):
+        """Select and show the row of the string at string_index."""
+        # rows are by string index
+        qindex = self.table_view.model().mapFromSource(
+            self.table_model.index(string_index, 0))
+        if qindex.isValid():
+            self.table_view.selectRow(qindex.row())
+            self.table_view.scrollTo(qindex)
+
 
 class GmdPlugin(EditorPlugin):
     pattern = "*.gmd"
@@ -1,10 +1,14 @@
 # coding: utf-8
 import logging
+import os
+from collections import OrderedDict
 from enum import IntEnum
 from fnmatch import fnmatch
 
 from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
 
+from mhw_armor_edit.ftypes.gmd import Gmd
+
 log = logging.getLogger()
 
 
@@ -155,10 +159,81 @@ class ATTRS:
     pass
 
 
+class RelationCache:
+    """Relation files shared by all open files using them, keyed by
+    absolute path.
+
+    A relation is loaded once, as a workspace file of its own, which
+    every file using it has as relation, so edits to it show in all of
+    them. Its dependents count the references to it, which
+    Workspace.close_file releases. Cached files changed on disk since
+    they were loaded or saved are reloaded when no file uses them. Of the
+    unused files, only the max_unused most recently used are kept, eg.
+    for switching languages back and forth. Unsaved edits of a relation
+    are dropped with the last file using it closing, as nothing shows or
+    saves them anymore.
+    """
+
+    def __init__(self, max_unused=16):
+        self.max_unused = max_unused
+        self.files = OrderedDict()
+
+    def lookup(self, abs_path):
+        """Get the cached file at abs_path if it's still usable, or None."""
+        abs_path = os.path.normpath(abs_path)
+        ws_file = self.files.get(abs_path)
+        if ws_file is not None and ws_file.abs_path == abs_path \
+                and (ws_file.is_synced() or ws_file.dependents):
+            self.files.move_to_end(abs_path)
+            return ws_file
+        return None
+
+    def get(self, directory, rel_path, ws_file_factory, data=None):
+        """Get the file at rel_path in directory, loading it unless it's
+        cached, from data if given."""
+        abs_path, _ = directory.get_child_path(rel_path)
+        ws_file = self.lookup(abs_path)
+        if ws_file is not None:
+            return ws_file
+        ws_file = ws_file_factory(directory, rel_path)
+        FilePluginRegistry.load_model(ws_file, True, data)
+        self.files[os.path.normpath(abs_path)] = ws_file
+        self.evict()
+        return ws_file
+
+    def is_unused(self, ws_file):
+        return not ws_file.dependents
+
+    def release(self, ws_files):
+        """Drop the files of ws_files no file uses anymore if they have
+        unsaved edits, and evict unused files."""
+        for ws_file in ws_files:
+            abs_path = os.path.normpath(ws_file.abs_path)
+            if self.is_unused(ws_file) and ws_file.data.modified \
+                    and self.files.get(abs_path) is ws_file:
+                log.debug("discarding edits of relation %s", abs_path)
+                del self.files[abs_path]
+        self.evict()
+
+    def evict(self):
+        unused = [path for path, ws_file in self.files.items()
+                  if self.is_unused(ws_file)]
+        for path in unused[:len(unused) - self.max_unused]:
+            log.debug("evicting relation %s", path)
+            del self.files[path]
+
+    def clear(self):
+        self.files.clear()
+
+
 class FilePluginRegistry:
     plugins = []
     relations = {}
     lang = "eng"
+    # map translations and other GMD relations in directories with
+    # use_mmap set, see can_map
+    use_mmap = True
+    relation_cache = RelationCache()
 
     @classmethod
     def get_plugin(cls, path):
@@ -167,42 +242,118 @@ class FilePluginRegistry:
                 return plugin
 
     @classmethod
-    def load_model(cls, ws_file, is_relation=False):
-        plugin = cls.get_plugin(ws_file.abs_path)
-        with open(ws_file.abs_path, "rb") as fp:
-            data = plugin.data_factory.load(fp)
-            ws_file.set_data(data)
+    def probe(cls, path):
+        """Probe the header of a file with its plugin's data factory,
+        None if no plugin handles the path."""
+        plugin = cls.get_plugin(path)
+        if plugin is None or plugin.data_factory is None:
+            return None
+        return plugin.data_factory.probe(path)
+
+    @classmethod
+    def can_map(cls, directory, abs_path, is_relation):
+        """Whether to map the file instead of reading it into memory.
+
+        A mapped file changed by another tool changes the data or crashes
+        the editor, and can't be replaced on Windows. So only relations
+        in directories other tools leave alone, like the chunk directory,
+        are mapped, and only GMDs, whose edits never write to the buffer.
+        """
+        plugin = cls.get_plugin(abs_path)
+        return cls.use_mmap and is_relation and directory.use_mmap \
+            and plugin is not None and plugin.data_factory is not None \
+            and issubclass(plugin.data_factory, Gmd)
+
+    @classmethod
+    def load_data(cls, abs_path, use_mmap=False):
+        """Load the data of the file at abs_path, safe to call from worker
+        threads."""
+        plugin = cls.get_plugin(abs_path)
+        if plugin is None:
+            raise ValueError(f"no editor for file {abs_path}")
+        with open(abs_path, "rb") as fp:
+            return plugin.data_factory.load(fp, use_mmap=use_mmap)
+
+    @classmethod
+    def load_model(cls, ws_file, is_relation=False, data=None):
+        if data is None:
+            data = cls.load_data(ws_file.abs_path, cls.can_map(
+                ws_file.directory, ws_file.abs_path, is_relation))
+        ws_file.set_data(data)
+        ws_file.mark_synced()
         return ws_file
 
     @classmethod
-    def load_relations(cls, ws_file, directories):
+    def find_relations(cls, rel_path, directories):
+        """Map the relation keys of the file at rel_path to the directory
+        and rel_path of the relation, for the relations found."""
+        result = {}
+        for key, value in cls.relations.get(rel_path, {}).items():
+            if key == ATTRS:
+                continue
+            found = cls._find_relation(directories, value)
+            if found is not None:
+                result[key] = found
+        return result
+
+    @classmethod
+    def load_relations(cls, ws_file, directories, datas=None):
+        """Add the relations of ws_file, datas maps absolute paths of
+        relations to their already loaded data."""
+        relations = cls.relations.get(ws_file.rel_path)
+        if not relations:
+            return
+        ws_file.set_attrs(relations.get(ATTRS, {}))
+        found = cls.find_relations(ws_file.rel_path, directories)
+        for key, (directory, relation_rpath) in found.items():
+            relation_path, _ = directory.get_child_path(relation_rpath)
+            data = (datas or {}).get(os.path.normpath(relation_path))
+            rel_ws_file = cls.relation_cache.get(
+                directory, relation_rpath, type(ws_file), data)
+            ws_file.add_relation(key, rel_ws_file)
+
+    @classmethod
+    def load_translations(cls, ws_file, directories):
+        """Replace the translation relations of ws_file by the ones in the
+        current language, without reloading ws_file itself."""
         relations = cls.relations.get(ws_file.rel_path)
         if not relations:
             return
         for key, value in relations.items():
-            if key == ATTRS:
-                ws_file.set_attrs(value)
+            if key == ATTRS or not cls.is_t9n(value):
                 continue
             rel_ws_file = cls._load_relation(ws_file, directories, value)
+            if rel_ws_file is ws_file.relations.get(key):
+                continue
+            ws_file.remove_relation(key)
             if rel_ws_file is not None:
                 ws_file.add_relation(key, rel_ws_file)
+        cls.relation_cache.evict()
 
     @classmethod
-    def _load_relation(cls, parent, directories, relation_rpath):
+    def _find_relation(cls, directories, relation_rpath):
+        relation_rpath = cls.handle_t9n_lang(relation_rpath)
         for directory in directories:
             if not directory.is_valid:
                 continue
-            relation_rpath = cls.handle_t9n_lang(relation_rpath)
             relation_path, exists = directory.get_child_path(relation_rpath)
             if exists:
-                rel_ws_file = type(parent)(
-                    directory,
-                    relation_rpath,
-                    parent=parent)
-                return cls.load_model(rel_ws_file, True)
+                return directory, relation_rpath
+        return None
+
+    @classmethod
+    def _load_relation(cls, parent, directories, relation_rpath):
+        found = cls._find_relation(directories, relation_rpath)
+        if found is not None:
+            return cls.relation_cache.get(*found, type(parent))
+
+    @classmethod
+    def is_t9n(cls, path):
+        return isinstance(path, str) and path.endswith("_eng.gmd")
 
     @classmethod
-    def handle_t9n_lang(cls, path):
-        if cls.lang != "eng" and path.endswith("_eng.gmd"):
-            return path.replace("_eng.gmd", f"_{cls.lang}.gmd")
+    def handle_t9n_lang(cls, path, lang=None):
+        lang = lang or cls.lang
+        if lang != "eng" and cls.is_t9n(path):
+            return path.replace("_eng.gmd", f"_{lang}.gmd")
         return path
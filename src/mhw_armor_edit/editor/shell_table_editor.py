@@ -131,6 +131,7 @@ class ShellTableTreeModel(TreeModel):
 
 
 class ShellTreeRootNode(TreeNode):
+    __slots__ = ("name", "capacity", "recoil", "reload")
     GroupKeys = (
         ("normal", 3),
         ("pierce", 3),
@@ -168,6 +169,8 @@ class ShellTreeRootNode(TreeNode):
 
 
 class ShellTreeGroupNode(TreeNode):
+    __slots__ = ("name", "capacity", "recoil", "reload")
+
     def __init__(self, group, ref, parent, row):
         super().__init__(parent, row)
         attr, count = group
@@ -182,6 +185,8 @@ class ShellTreeGroupNode(TreeNode):
 
 
 class ShellTreeEntryNode(TreeNode):
+    __slots__ = ("ref", "attr", "name")
+
     def __init__(self, attr, num, count, ref, parent, row):
         super().__init__(parent, row)
         self.ref = ref
@@ -173,8 +173,8 @@ class WpDatGEditor(WeaponGunEditorWidgetBase, WeaponGunEditorWidget):
         if self.is_bow_type:
             self.bottle_table_model.update(model)
             self.hide_tab(self.tab_shell_table)
-            self.special_ammo_type_value.deleteLater()
-            self.special_ammo_type_label.deleteLater()
+            self.special_ammo_type_value.hide()
+            self.special_ammo_type_label.hide()
         else:
             self.shell_table_model.update(model)
             self.hide_tab(self.tab_bottle_table)
@@ -1,5 +1,65 @@
 # coding: utf-8
+import builtins
+import io
+import mmap
+import os
 import struct
+import weakref
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain
+from collections.abc import Sequence
+from operator import index as as_index
+
+from mhw_armor_edit.ftypes.index import StructIndex
+from mhw_armor_edit.ftypes.ranges import RangeSet
+
+
+def load_buffer(fp, use_mmap=False):
+    """Read the whole file into a writable buffer.
+
+    With use_mmap the file is mapped privately (copy-on-write): nothing is
+    copied up front, and pages are only copied into memory when written to.
+    Files that can't be mapped (empty files, in-memory streams) are read
+    into a bytearray instead. Only map files nothing else writes to while
+    mapped: pages not yet written show changes made to the file, and
+    truncating it makes reading them crash the process.
+    """
+    if use_mmap:
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+    return bytearray(fp.read())
+
+
+ProbeResult = namedtuple("ProbeResult", (
+    "magic",
+    "num_entries",
+    "expected_size",
+    "actual_size",
+    "valid",
+    "error",
+))
+
+
+def read_header(path, size):
+    """Read the first size bytes of a file and stat it, for probing."""
+    with open(path, "rb") as fp:
+        header = fp.read(size)
+        actual_size = os.fstat(fp.fileno()).st_size
+    return header, actual_size
+
+
+def release_buffer(data):
+    """Unmap a buffer returned by load_buffer, if it is still exported
+    (eg. by a numpy view) it is left for the garbage collector."""
+    if isinstance(data, mmap.mmap):
+        try:
+            data.close()
+        except BufferError:
+            pass
 
 
 class StructField:
@@ -32,10 +92,13 @@ class StructField:
             return self
         if value is None:
             return
-        prev_value = self.__get__(instance, None)
-        struct.pack_into(
-            self.fmt, instance.data, instance.offset + self.offset, value)
-        instance.modified = value != prev_value
+        data = instance.data
+        start = instance.offset + self.offset
+        end = start + self.size
+        prev_bytes = data[start:end]
+        struct.pack_into(self.fmt, data, start, value)
+        if data[start:end] != prev_bytes:
+            instance.parent.mark_dirty(start, end, prev_bytes)
 
     def __lt__(self, other):
         return self.offset < other.offset
@@ -81,6 +144,78 @@ class pad(StructField):
         super().__init__(0, 0, f"<{count}B", True)
 
 
+_GETTER_SOURCE = """\
+def fget(self):
+    return unpack_from(self.data, self.offset + {offset})[0]
+"""
+_MULTI_GETTER_SOURCE = """\
+def fget(self):
+    return " ".join(format(it, "02X")
+                    for it in unpack_from(self.data, self.offset + {offset}))
+"""
+_SETTER_SOURCE = """\
+def fset(self, value):
+    if value is None:
+        return
+    new_bytes = pack({value})
+    start = self.offset + {offset}
+    end = start + {size}
+    data = self.data
+    old_bytes = data[start:end]
+    if old_bytes != new_bytes:
+        data[start:end] = new_bytes
+        self.parent.mark_dirty(start, end, old_bytes)
+"""
+
+
+def _parse_multi(value):
+    if isinstance(value, str):
+        return [builtins.int(it, 16) for it in value.split()]
+    return value
+
+
+class FieldAccessor(property):
+    """Specialized accessor StructMeta generates for each StructField.
+
+    The getter and setter are compiled for the field's fixed offset and
+    size with its precompiled struct.Struct bound in, which avoids the
+    generic descriptor's format lookups and branches on every access.
+    Field metadata (index, offset, size, fmt, multi, after) is forwarded
+    to the StructField.
+    """
+
+    def __init__(self, field):
+        compiled = struct.Struct(field.fmt)
+        namespace = {
+            "unpack_from": compiled.unpack_from,
+            "pack": compiled.pack,
+            "parse": _parse_multi,
+        }
+        source = _MULTI_GETTER_SOURCE if field.multi else _GETTER_SOURCE
+        source += _SETTER_SOURCE
+        exec(source.format(
+            offset=field.offset,
+            size=field.size,
+            value="*parse(value)" if field.multi else "value",
+        ), namespace)
+        super().__init__(namespace["fget"], namespace["fset"])
+        self.field = field
+
+    def __getattr__(self, name):
+        try:
+            field = self.__dict__["field"]
+        except KeyError:
+            raise AttributeError(name) from None
+        return getattr(field, name)
+
+    def __lt__(self, other):
+        return self.offset < other.offset
+
+    def __repr__(self):
+        return f"<FieldAccessor {self._name} " \
+               f"offset={self.offset} fmt={self.fmt!r}>"
+
+
 class StructMeta(type):
     @staticmethod
     def fields_from_fields_attr(namespace):
@@ -126,6 +261,44 @@ class StructMeta(type):
                 pass
         return offset
 
+    @staticmethod
+    def init_record(name, namespace):
+        """Precompile one struct.Struct for the full record layout.
+
+        Multi-value fields (eg. padding) unpack to several items, so
+        ``__record_groups__`` maps them back to one value per field. It is
+        None when every field unpacks to exactly one item.
+        """
+        fmt = "<"
+        groups = []
+        start = 0
+        for field_name in namespace["__fields__"]:
+            field = namespace[field_name]
+            fmt += field.fmt.lstrip("@=<>!")
+            count = len(struct.unpack(field.fmt, bytes(field.size)))
+            groups.append((start, start + count, field.multi))
+            start += count
+        record = struct.Struct(fmt)
+        assert record.size == namespace["STRUCT_SIZE"], \
+            f"invalid record size for {name}. " \
+            f"expected {namespace['STRUCT_SIZE']}, got {record.size}"
+        namespace["__record__"] = record
+        namespace["__field_index__"] = {
+            field_name: i
+            for i, field_name in enumerate(namespace["__fields__"])
+        }
+        if start == len(groups) and not any(it[2] for it in groups):
+            namespace["__record_groups__"] = None
+        else:
+            namespace["__record_groups__"] = tuple(groups)
+
+    @staticmethod
+    def init_accessors(namespace):
+        for field_name in namespace["__fields__"]:
+            field = namespace[field_name]
+            field._name = field_name
+            namespace[field_name] = FieldAccessor(field)
+
     @staticmethod
     def init_fields(name, namespace):
         assert "STRUCT_SIZE" in namespace, f"missing expected {name}.STRUCT_SIZE class attr"
@@ -142,6 +315,11 @@ class StructMeta(type):
     def __new__(cls, name, bases, namespace, **kwargs):
         if name != "Struct":
             StructMeta.init_fields(name, namespace)
+            StructMeta.init_record(name, namespace)
+            StructMeta.init_accessors(namespace)
+            # entries only store what Struct declares, subclasses needing
+            # more instance attributes declare their own __slots__
+            namespace.setdefault("__slots__", ())
         return type.__new__(cls, name, bases, namespace)
 
 
@@ -151,13 +329,27 @@ class StructFile:
     MAGIC_OFFSET = 4
     NUM_ENTRY_OFFSET = 6
     ENTRY_OFFSET = 10
+    # field name tuples to build hash indexes on, on first use by find
+    INDEXES = ()
+
+    # unchanged bytes between dirty ranges written anyway by save_dirty,
+    # to turn many tiny writes into fewer larger ones
+    DIRTY_WRITE_GAP = 64
 
     def __init__(self, data):
         self.modified = False
         self.modified_cb = None
+        self.dirty = RangeSet()
+        self._batch_depth = 0
+        self._batch_modified = False
+        self.indexes = {}
+        # optional undo journal, see ftypes.journal.Journal
+        self.journal = None
+        # called with (start, end) of every changed data range
+        self.changed_cb = None
         self.data = data
         self.num_entries = self._read_num_entries()
-        self.entries = list(self._load_entries())
+        self.entries = StructEntries(self)
 
     def _read_num_entries(self):
         result = struct.unpack_from("<I", self.data, self.NUM_ENTRY_OFFSET)
@@ -165,8 +357,11 @@ class StructFile:
 
     def _load_entries(self):
         for i in range(0, self.num_entries):
-            offset = self.ENTRY_OFFSET + i * self.EntryFactory.STRUCT_SIZE
-            yield self.EntryFactory(self, i, self.data, offset)
+            yield self.create_entry(i)
+
+    def create_entry(self, index):
+        offset = self.ENTRY_OFFSET + index * self.EntryFactory.STRUCT_SIZE
+        return self.EntryFactory(self, index, self.data, offset)
 
     def __getitem__(self, item):
         return self.entries[item]
@@ -174,59 +369,329 @@ class StructFile:
     def __len__(self):
         return len(self.entries)
 
-    def find(self, **attrs):
-        for item in self.entries:
+    def iter_values(self):
+        """Decode all entries with a single pass over the entry data."""
+        factory = self.EntryFactory
+        end = self.ENTRY_OFFSET + self.num_entries * factory.STRUCT_SIZE
+        view = memoryview(self.data)[self.ENTRY_OFFSET:end]
+        try:
+            for raw in factory.__record__.iter_unpack(view):
+                yield factory.decode_record(raw)
+        finally:
+            view.release()
+
+    def as_dicts(self):
+        fields = self.EntryFactory.__fields__
+        return [dict(zip(fields, values)) for values in self.iter_values()]
+
+    def as_array(self):
+        """Get a zero-copy numpy structured array view over all entries.
+
+        Requires numpy. See :class:`~mhw_armor_edit.ftypes.struct_array.StructArray`.
+        """
+        from mhw_armor_edit.ftypes.struct_array import StructArray
+        return StructArray.from_file(self)
+
+    def column(self, field):
+        """Get all values of one field as a read-only numpy array."""
+        return self.as_array()[field]
+
+    def query(self, **conditions):
+        """Select entries with vectorized field comparisons.
+
+        Requires numpy. See :class:`~mhw_armor_edit.ftypes.struct_array.Query`
+        for the condition syntax, eg. ``query(rarity__ge=10, element_id=3)``.
+        """
+        from mhw_armor_edit.ftypes.struct_array import Query
+        return Query(**conditions)(self)
+
+    def set_column(self, field, values, where=None, overflow="raise"):
+        """Assign a field of all or selected entries in one pass.
+
+        Requires numpy. See StructArray.set_column.
+        """
+        return self.as_array().set_column(field, values, where, overflow)
+
+    def update_column(self, field, op, operand, where=None,
+                      overflow="raise"):
+        """Apply arithmetic to a field of all or selected entries, eg.
+        ``update_column("raw_damage", "mul", 1.1, where=query)``.
+
+        Requires numpy. See StructArray.update_column.
+        """
+        return self.as_array().update_column(field, op, operand, where,
+                                             overflow)
+
+    def build_index(self, *fields):
+        """Get the hash index on fields, building it if necessary."""
+        index = self.indexes.get(fields)
+        if index is None:
+            index = StructIndex(self, fields)
+            self.indexes[fields] = index
+        return index
+
+    def _index_for(self, keys):
+        best = None
+        for fields in chain(self.indexes, self.INDEXES):
+            if set(fields) <= keys and (best is None or len(fields) > len(best)):
+                best = fields
+        if best is not None:
+            return self.build_index(*best)
+
+    def _refresh_indexes(self, start, end):
+        size = self.EntryFactory.STRUCT_SIZE
+        first = max((start - self.ENTRY_OFFSET) // size, 0)
+        last = min((end - 1 - self.ENTRY_OFFSET) // size, self.num_entries - 1)
+        for index in range(first, last + 1):
+            entry_start = self.ENTRY_OFFSET + index * size
+            rel_start = max(start - entry_start, 0)
+            rel_end = min(end - entry_start, size)
+            for struct_index in self.indexes.values():
+                if struct_index.covers(rel_start, rel_end):
+                    struct_index.refresh(self, index)
+
+    def find_indexes(self, **attrs):
+        """Yield indexes of entries matching all attrs, using a hash index
+        on some or all of the attrs if one is declared or built."""
+        struct_index = self._index_for(attrs.keys())
+        if struct_index is None:
+            candidates = range(self.num_entries)
+        else:
+            candidates = struct_index.lookup(
+                tuple(attrs[it] for it in struct_index.fields))
+            attrs = {key: value for key, value in attrs.items()
+                     if key not in struct_index.fields}
+        for index in candidates:
+            item = self.entries[index]
             attrs_match = all(
                 getattr(item, key, None) == value
                 for key, value in attrs.items()
             )
             if attrs_match:
-                yield item
+                yield index
+
+    def find(self, **attrs):
+        for index in self.find_indexes(**attrs):
+            yield self.entries[index]
 
     def find_first(self, **attrs):
         for item in self.find(**attrs):
             return item
 
     @classmethod
-    def check_header(cls, data):
-        result = struct.unpack_from('<H', data, cls.MAGIC_OFFSET)
-        if result[0] != cls.MAGIC:
-            raise InvalidDataError(
-                f"magic byte invalid on type {cls.__name__}: expected {cls.MAGIC:04X}, "
-                f"found {result[0]:04X}")
-        result = struct.unpack_from("<I", data, cls.NUM_ENTRY_OFFSET)
-        num_entries = result[0]
+    def probe_header(cls, header, actual_size):
+        """Validate header bytes against the total size of the file."""
+        if len(header) < cls.ENTRY_OFFSET:
+            return ProbeResult(None, None, None, actual_size, False,
+                               f"file too small for type {cls.__name__}: "
+                               f"found {actual_size} bytes")
+        magic = struct.unpack_from("<H", header, cls.MAGIC_OFFSET)[0]
+        num_entries = struct.unpack_from("<I", header, cls.NUM_ENTRY_OFFSET)[0]
         entries_size = num_entries * cls.EntryFactory.STRUCT_SIZE
-        data_entries_size = len(data) - cls.ENTRY_OFFSET
-        if data_entries_size != entries_size:
-            raise InvalidDataError(f"total size invalid on type {cls.__name__}: "
-                                   f"expected {entries_size} bytes, "
-                                   f"found {data_entries_size}")
+        expected_size = cls.ENTRY_OFFSET + entries_size
+        error = None
+        if magic != cls.MAGIC:
+            error = f"magic byte invalid on type {cls.__name__}: " \
+                    f"expected {cls.MAGIC:04X}, found {magic:04X}"
+        elif actual_size != expected_size:
+            error = f"total size invalid on type {cls.__name__}: " \
+                    f"expected {entries_size} bytes, " \
+                    f"found {actual_size - cls.ENTRY_OFFSET}"
+        return ProbeResult(magic, num_entries, expected_size, actual_size,
+                           error is None, error)
+
+    @classmethod
+    def probe(cls, path):
+        """Read only the header and size of the file at path, to identify
+        and validate it without loading it."""
+        return cls.probe_header(*read_header(path, cls.ENTRY_OFFSET))
+
+    @classmethod
+    def check_header(cls, data):
+        result = cls.probe_header(data[:cls.ENTRY_OFFSET], len(data))
+        if not result.valid:
+            raise InvalidDataError(result.error)
         return True
 
     @classmethod
-    def load(cls, fp):
-        data = bytearray(fp.read())
+    def load(cls, fp, use_mmap=False):
+        data = load_buffer(fp, use_mmap)
         cls.check_header(data)
         return cls(data)
 
+    @property
+    def is_mapped(self):
+        return isinstance(self.data, mmap.mmap)
+
+    def detach(self):
+        """Copy a memory-mapped buffer into a private bytearray.
+
+        Must happen before the mapped file itself gets overwritten. Live
+        entries are moved to the new buffer, array views are not.
+        """
+        if not self.is_mapped:
+            return
+        mapped = self.data
+        self.data = bytearray(mapped)
+        self.entries.rebind(self.data)
+        release_buffer(mapped)
+
     def save(self, fp):
+        self.detach()
         fp.write(self.data)
         self.clear_modified()
 
+    def save_dirty(self, fp):
+        """Write only the dirty ranges into fp, which has to contain the
+        data as it was when last loaded or saved."""
+        view = memoryview(self.data)
+        try:
+            for start, end in self.dirty.coalesced(self.DIRTY_WRITE_GAP):
+                fp.seek(start)
+                fp.write(view[start:end])
+        finally:
+            view.release()
+        self.clear_modified()
+
+    def mark_dirty(self, start, end, old_bytes=None):
+        """Flag the already written bytes [start, end) as changed.
+
+        Writers pass the replaced old_bytes, for the journal to record.
+        """
+        if self.journal is not None and old_bytes is not None:
+            self.journal.record(start, bytes(old_bytes),
+                                bytes(self.data[start:end]))
+        self.dirty.add(start, end)
+        if self.indexes:
+            self._refresh_indexes(start, end)
+        if self.changed_cb:
+            self.changed_cb(start, end)
+        self.set_modified(True)
+
+    def changed_fields(self):
+        """Map entry index to the names of fields inside dirty ranges."""
+        return self.fields_in_ranges(self.dirty)
+
+    def fields_in_ranges(self, ranges):
+        """Map entry index to the names of fields overlapping any of the
+        ``(start, end)`` data ranges."""
+        factory = self.EntryFactory
+        fields = sorted(getattr(factory, it) for it in factory.__fields__)
+        offsets = [it.offset for it in fields]
+        result = {}
+        for start, end in ranges:
+            pos = start
+            while pos < end:
+                index, rel = divmod(pos - self.ENTRY_OFFSET,
+                                    factory.STRUCT_SIZE)
+                if index < 0:
+                    pos = self.ENTRY_OFFSET
+                    continue
+                field = fields[bisect_right(offsets, rel) - 1]
+                names = result.setdefault(index, [])
+                if field._name not in names:
+                    names.append(field._name)
+                pos += field.after - rel
+        return result
+
     def clear_modified(self):
         self.modified = False
+        self.dirty.clear()
         if self.modified_cb:
             self.modified_cb(self.modified)
 
     def set_modified(self, value):
         modified = self.modified
         self.modified = self.modified or value
-        if self.modified != modified:
+        if self._batch_depth:
+            return
+        if self.modified != modified and self.modified_cb:
             self.modified_cb(value)
 
+    @contextmanager
+    def batch(self):
+        """Group writes, modified_cb is called at most once at the end and
+        the journal records them as one step."""
+        if not self._batch_depth:
+            self._batch_modified = self.modified
+        self._batch_depth += 1
+        journal = self.journal
+        if journal is not None:
+            journal.begin()
+        try:
+            yield self
+        finally:
+            if journal is not None:
+                journal.end()
+            self._batch_depth -= 1
+            if not self._batch_depth \
+                    and self.modified != self._batch_modified \
+                    and self.modified_cb:
+                self.modified_cb(self.modified)
+
+    def update_entries(self, mappings):
+        """Update entries in order from a sequence of field mappings.
+
+        Mappings beyond the last entry are ignored. Returns the number of
+        entries updated.
+        """
+        factory = self.EntryFactory
+        num_items = min(len(mappings), self.num_entries)
+        with self.batch():
+            for index in range(num_items):
+                offset = self.ENTRY_OFFSET + index * factory.STRUCT_SIZE
+                factory.write_record(self, self.data, offset, mappings[index])
+        return num_items
+
+
+class StructEntries(Sequence):
+    """Lazy sequence of the entries of a StructFile.
+
+    Entries are created on first access and cached weakly, so an entry lives
+    only as long as something (eg. a tree node) holds on to it, while
+    repeated access to a live entry returns the same object.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self._cache = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return self.parent.num_entries
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        index = as_index(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("entry index out of range")
+        return self._get(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def rebind(self, data):
+        for entry in self._cache.values():
+            entry.data = data
+
+    def _get(self, index):
+        entry = self._cache.get(index)
+        if entry is None:
+            entry = self.parent.create_entry(index)
+            self._cache[index] = entry
+        return entry
+
+    def __repr__(self):
+        return f"<StructEntries {self.parent.__class__.__name__} " \
+               f"entries={len(self)} live={len(self._cache)}>"
+
 
 class Struct(metaclass=StructMeta):
+    __slots__ = ("parent", "index", "data", "offset", "__weakref__")
+
     def __init__(self, parent, index, data, offset):
         self.parent = parent
         self.index = index
@@ -237,11 +702,67 @@ class Struct(metaclass=StructMeta):
     def fields(cls):
         return tuple(cls.__fields__)
 
+    @classmethod
+    def decode_record(cls, raw):
+        """Turn a tuple unpacked by ``__record__`` into one value per field."""
+        groups = cls.__record_groups__
+        if groups is None:
+            return raw
+        return tuple(
+            " ".join(f"{it:02X}" for it in raw[start:end]) if multi
+            else raw[start]
+            for start, end, multi in groups
+        )
+
+    @classmethod
+    def encode_record(cls, values):
+        """Inverse of decode_record, flatten field values for packing."""
+        groups = cls.__record_groups__
+        if groups is None:
+            return values
+        raw = []
+        for value, (start, end, multi) in zip(values, groups):
+            if multi and isinstance(value, str):
+                # this module's int field type shadows the builtin
+                value = [builtins.int(it, 16) for it in value.split()]
+            elif not multi and end - start == 1:
+                value = (value,)
+            if len(value) != end - start:
+                raise ValueError(f"expected {end - start} values, "
+                                 f"got {len(value)}")
+            raw.extend(value)
+        return raw
+
+    @classmethod
+    def write_record(cls, parent, data, offset, mapping):
+        """Write several fields of the record at offset with one pack.
+
+        Unknown keys and None values are ignored, like with setattr. Only
+        fields with changed bytes are marked dirty on the parent.
+        """
+        field_index = cls.__field_index__
+        keys = [key for key, value in mapping.items()
+                if value is not None and key in field_index]
+        if not keys:
+            return
+        end = offset + cls.STRUCT_SIZE
+        prev_bytes = data[offset:end]
+        values = list(cls.decode_record(cls.__record__.unpack(prev_bytes)))
+        for key in keys:
+            values[field_index[key]] = mapping[key]
+        new_bytes = cls.__record__.pack(*cls.encode_record(values))
+        if new_bytes == prev_bytes:
+            return
+        data[offset:end] = new_bytes
+        for key in keys:
+            field = getattr(cls, key)
+            if new_bytes[field.offset:field.after] \
+                    != prev_bytes[field.offset:field.after]:
+                parent.mark_dirty(offset + field.offset, offset + field.after,
+                                  prev_bytes[field.offset:field.after])
+
     def as_dict(self):
-        return {
-            attr: getattr(self, attr)
-            for attr in self.__fields__
-        }
+        return dict(zip(self.__fields__, self.values()))
 
     def __setitem__(self, key, value):
         if key in self.__fields__:
@@ -253,15 +774,12 @@ class Struct(metaclass=StructMeta):
         raise KeyError(key)
 
     def values(self):
-        return tuple(
-            getattr(self, attr)
-            for attr in self.__fields__
-        )
+        raw = self.__record__.unpack_from(self.data, self.offset)
+        return self.decode_record(raw)
 
     def update(self, mapping):
-        for key, value in mapping.items():
-            if key in self.__fields__:
-                setattr(self, key, value)
+        with self.parent.batch():
+            self.write_record(self.parent, self.data, self.offset, mapping)
 
     def __repr__(self):
         class_name = self.__class__.__name__
@@ -51,3 +51,4 @@ class AmDatEntry(Struct):
 class AmDat(StructFile):
     MAGIC = 0x005F
     EntryFactory = AmDatEntry
+    INDEXES = (("id",),)
@@ -29,3 +29,4 @@ class EqCrtEntry(Struct):
 class EqCrt(StructFile):
     EntryFactory = EqCrtEntry
     MAGIC = 0x0079
+    INDEXES = (("equip_id",), ("equip_type", "equip_id"))
@@ -31,3 +31,4 @@ class EqCusEntry(Struct):
 class EqCus(StructFile):
     EntryFactory = EqCusEntry
     MAGIC = 0x0058
+    INDEXES = (("equip_type", "equip_id"),)
@@ -1,14 +1,24 @@
 # coding: utf-8
 import logging
-from collections import namedtuple
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import namedtuple, OrderedDict
+from collections.abc import Sequence
+from itertools import accumulate, chain
 
 from mhw_armor_edit import ftypes as ft
-from mhw_armor_edit.ftypes import (InvalidDataError, Struct)
+from mhw_armor_edit.ftypes import (InvalidDataError, Struct, load_buffer,
+                                   ProbeResult, read_header, release_buffer)
 
 log = logging.getLogger(__name__)
 
 
 class GmdHeader(Struct):
+    __slots__ = ("name",)
     STRUCT_SIZE = 40
     magic: ft.uint()
     version: ft.uint()
@@ -49,61 +59,135 @@ class GmdInfoItem(Struct):
     list_index: ft.long()
 
 
-class GmdInfoItemKeyless:
-    def __init__(self, parent, index):
-        self.__dict__.update(parent)
-        self.index = index
-        self.string_index = index
-        self.key_offset = -1
+# info item layout for writing, with the hashes unsigned
+INFO_RECORD = struct.Struct("<III4xqq")
+
+class GmdInfoRow(namedtuple("GmdInfoRow", (
+    "index",
+    "string_index",
+    "hash_key_2x",
+    "hash_key_3x",
+    "pad",
+    "key_offset",
+    "list_index",
+))):
+    __slots__ = ()
 
     def as_dict(self):
-        return {
-            key: getattr(self, key)
-            for key in GmdInfoItem.fields()
-        }
+        return {key: getattr(self, key) for key in GmdInfoItem.fields()}
+
 
-    def values(self):
-        return tuple(
-            getattr(self, key)
-            for key in GmdInfoItem.fields()
-        )
+def signed32(value):
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def info_columns(data, offset, count):
+    """Decode count info items at offset into parallel arrays of
+    string_index, hash_key_2x, hash_key_3x, key_offset and list_index."""
+    block = bytes(data[offset:offset + count * GmdInfoItem.STRUCT_SIZE])
+    words = array("I", block)
+    signed = array("i", block)
+    longs = array("q", block)
+    if sys.byteorder == "big":
+        for it in (words, signed, longs):
+            it.byteswap()
+    # an item is 8 words or 4 longs
+    return words[0::8], signed[1::8], signed[2::8], longs[2::4], longs[3::4]
 
 
 class GmdInfoTable:
+    """Info items of the keyed strings, as parallel arrays by key index.
+
+    Rows of the table are by string index, strings without key have no
+    info item, their rows are implicit. Row objects (GmdInfoRow) are only
+    created when asked for.
+    """
+
     def __init__(self, data, offset, key_count, string_count):
         self.data = data
         self.offset = offset
         self.key_count = key_count
         self.string_count = string_count
-        self.items = tuple(self._read_items(data))
-
-    def _read_items(self, data):
-        prev_string_index = 0
-        for key_index in range(self.key_count):
-            item = GmdInfoItem(
-                self, key_index, data,
-                self.offset + key_index * GmdInfoItem.STRUCT_SIZE)
-            for missing_string_index in range(prev_string_index + 1, item.string_index):
-                yield GmdInfoItemKeyless(item.as_dict(), missing_string_index)
-            prev_string_index = item.string_index
-            yield item
-        for key_index in range(prev_string_index + 1, self.string_count):
-            yield GmdInfoItemKeyless({
-                "hash_key_2x": "",
-                "hash_key_3x": "",
-                "pad": "",
-                "list_index": 0,
-            }, key_index)
+        (self.string_index, self.hash_key_2x, self.hash_key_3x,
+         self.key_offset, self.list_index) = \
+            info_columns(data, offset, key_count)
+        # records of info items added after loading
+        self.added = bytearray()
 
     @property
     def after(self):
         return self.offset + (self.key_count * GmdInfoItem.STRUCT_SIZE)
 
+    @property
+    def total_key_count(self):
+        return len(self.string_index)
+
+    def key_index_of(self, string_index):
+        """Get the key index of the string at string_index, or None for
+        strings without key."""
+        key_index = bisect_left(self.string_index, string_index)
+        if key_index < len(self.string_index) \
+                and self.string_index[key_index] == string_index:
+            return key_index
+        return None
+
+    def _record(self, key_index):
+        if key_index < self.key_count:
+            return self.data, self.offset + key_index * GmdInfoItem.STRUCT_SIZE
+        return self.added, \
+            (key_index - self.key_count) * GmdInfoItem.STRUCT_SIZE
+
+    def record(self, key_index):
+        """Get the info item of the key_index-th key."""
+        data, offset = self._record(key_index)
+        pad_offset = offset + GmdInfoItem.pad.offset
+        return GmdInfoRow(
+            key_index,
+            self.string_index[key_index],
+            self.hash_key_2x[key_index],
+            self.hash_key_3x[key_index],
+            " ".join(format(it, "02X")
+                     for it in data[pad_offset:pad_offset + 4]),
+            self.key_offset[key_index],
+            self.list_index[key_index])
+
+    def set_list_index(self, key_index, list_index):
+        data, offset = self._record(key_index)
+        struct.pack_into("<q", data, offset + GmdInfoItem.list_index.offset,
+                         list_index)
+        self.list_index[key_index] = list_index
+
+    def add(self, string_index, key_offset, hash_2x, hash_3x):
+        """Append an info item for a new key, return its key index."""
+        key_index = self.total_key_count
+        self.added += INFO_RECORD.pack(string_index, hash_2x, hash_3x,
+                                       key_offset, 0)
+        self.string_index.append(string_index)
+        self.hash_key_2x.append(signed32(hash_2x))
+        self.hash_key_3x.append(signed32(hash_3x))
+        self.key_offset.append(key_offset)
+        self.list_index.append(0)
+        self.string_count = max(self.string_count, string_index + 1)
+        return key_index
+
+    def add_keyless(self, string_index):
+        self.string_count = max(self.string_count, string_index + 1)
+
     def __iter__(self):
-        return iter(self.items)
+        return (self[index] for index in range(len(self)))
 
     def __getitem__(self, index):
-        return self.items[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("info table index out of range")
+        key_index = self.key_index_of(index)
+        if key_index is None:
+            return GmdInfoRow(None, index, "", "", "", -1, 0)
+        return self.record(key_index)
+
+    def __len__(self):
+        return self.string_count
 
 
 class GmdBucketItem(Struct):
@@ -134,56 +218,335 @@ class GmdBucketList:
     def after(self):
         return self.offset + self.SIZE
 
+    def set_head(self, bucket, key_index):
+        struct.pack_into("<q", self.data, self.offset + bucket * 8, key_index)
+
+
+def write_string(out, pos, value):
+    """Write value NUL terminated into out at pos, return the position
+    after it."""
+    encoded = value.encode("UTF-8")
+    out[pos:pos + len(encoded)] = encoded
+    out[pos + len(encoded)] = 0
+    return pos + len(encoded) + 1
+
+
+def split_block(data, start, end):
+    """Split the NUL terminated UTF-8 strings in data[start:end].
+
+    The whole block is decoded at once, which works since NUL bytes never
+    occur inside multi-byte UTF-8 sequences.
+    """
+    view = memoryview(data)[start:end]
+    try:
+        # the block ends with a NUL, leaving an empty last item
+        return str(view, "UTF-8").split("\x00")[:-1]
+    finally:
+        view.release()
+
+
+def block_offsets(data, start, end):
+    """Get the start offsets of the NUL terminated strings in
+    data[start:end], relative to start, followed by the block size."""
+    view = memoryview(data)[start:end]
+    try:
+        sizes = map(len, view.tobytes().split(b"\x00"))
+    finally:
+        view.release()
+    offsets = array("I", accumulate(chain((0,), (it + 1 for it in sizes))))
+    # the block ends with a NUL, the empty item after it isn't a string
+    del offsets[-1]
+    return offsets
+
 
 class GmdStringTable:
+    """Strings of a GMD, decoded on first access.
+
+    Only the offset of each string into the block is kept, decoded strings
+    go into a bounded cache. Iterating decodes the whole block at once.
+    """
+    CACHE_SIZE = 2048
+
     def __init__(self, data, offset, block_size, count):
         self.data = data
         self.offset = offset
         self.block_size = block_size
         self.count = count
-        self.items = self._read_items()
-        if len(self.items) != self.count:
+        self.offsets = block_offsets(data, offset, self.after)
+        self.base_count = len(self.offsets) - 1
+        # edits, replaced strings by index and strings added at the end
+        self.overrides = {}
+        self.added = []
+        self._cache = OrderedDict()
+        if self.base_count != self.count:
             raise InvalidDataError(
-                f"expected {self.count} keys, read {len(self.items)}.")
+                f"expected {self.count} keys, read {self.base_count}.")
 
     def __iter__(self):
-        return iter(self.items)
+        items = split_block(self.data, self.offset, self.after)
+        for index, value in self.overrides.items():
+            items[index] = value
+        return chain(items, self.added)
 
     def __getitem__(self, key):
         if key == -1:
             return ""
-        return self.items[key]
+        return self.get(key)
+
+    def get(self, index):
+        """Get the string at index, decoding it if not cached."""
+        cache = self._cache
+        value = cache.get(index)
+        if value is not None:
+            cache.move_to_end(index)
+            return value
+        if index in self.overrides:
+            return self.overrides[index]
+        if not 0 <= index < self.base_count:
+            if self.base_count <= index < len(self):
+                return self.added[index - self.base_count]
+            raise IndexError("string index out of range")
+        start = self.offset + self.offsets[index]
+        end = self.offset + self.offsets[index + 1] - 1
+        value = self.data[start:end].decode("UTF-8")
+        cache[index] = value
+        if len(cache) > self.CACHE_SIZE:
+            cache.popitem(last=False)
+        return value
 
     def __len__(self):
-        return len(self.items)
+        return self.base_count + len(self.added)
 
     @property
     def after(self):
         return self.offset + self.block_size
 
-    def _read_items(self):
-        return [
-            it.decode("UTF-8")
-            for it in self.data[self.offset:-1].split(b"\x00")
-        ]
+    def set(self, index, value):
+        if not 0 <= index < len(self):
+            raise IndexError("string index out of range")
+        if index >= self.base_count:
+            self.added[index - self.base_count] = value
+        else:
+            self.overrides[index] = value
+            self._cache.pop(index, None)
+
+    def append(self, value):
+        self.added.append(value)
+        return len(self) - 1
+
+    def write_block(self, out, pos):
+        """Write the block with all edits into out at pos, return the
+        position after it.
+
+        Runs of unchanged strings are copied from the buffer as they are.
+        """
+        offset = self.offset
+        offsets = self.offsets
+        run_start = 0
+        for index in sorted(self.overrides):
+            start, end = offset + offsets[run_start], offset + offsets[index]
+            out[pos:pos + end - start] = self.data[start:end]
+            pos += end - start
+            pos = write_string(out, pos, self.overrides[index])
+            run_start = index + 1
+        start, end = offset + offsets[run_start], self.after
+        out[pos:pos + end - start] = self.data[start:end]
+        pos += end - start
+        for value in self.added:
+            pos = write_string(out, pos, value)
+        return pos
+
+    def written_size(self):
+        """Size of the block with all edits."""
+        size = self.block_size
+        for index, value in self.overrides.items():
+            size += len(value.encode("UTF-8")) + 1 \
+                    - (self.offsets[index + 1] - self.offsets[index])
+        return size + sum(len(it.encode("UTF-8")) + 1 for it in self.added)
 
 
 class GmdKeyTable(GmdStringTable):
-    def _read_items(self):
-        i = 0
-        offset = 0
-        items = {}
-        val = bytearray()
-        while i < self.block_size:
-            ch = self.data[self.offset + i]
-            i += 1
-            if ch == 0:
-                items[offset] = val.decode("UTF-8")
-                val = bytearray()
-                offset = i
-            else:
-                val.append(ch)
-        return items
+    """Keys are referenced by their offset into the key block."""
+
+    def __init__(self, data, offset, block_size, count):
+        super().__init__(data, offset, block_size, count)
+        self.added_offsets = []
+
+    def __getitem__(self, key_offset):
+        if key_offset == -1:
+            return ""
+        return self.get(self.index_of(key_offset))
+
+    def append(self, value):
+        """Add a key, return its key offset."""
+        key_offset = self.written_size()
+        self.added.append(value)
+        self.added_offsets.append(key_offset)
+        return key_offset
+
+    def index_of(self, key_offset):
+        if key_offset >= self.block_size:
+            index = bisect_left(self.added_offsets, key_offset)
+            if index >= len(self.added_offsets) \
+                    or self.added_offsets[index] != key_offset:
+                raise KeyError(key_offset)
+            return self.base_count + index
+        index = bisect_left(self.offsets, key_offset)
+        if index >= self.base_count or self.offsets[index] != key_offset:
+            raise KeyError(key_offset)
+        return index
+
+
+class GmdDisplayStrings:
+    """Strings of a string table as shown in editors, with the icon tags
+    replaced and blank strings marked. Each string is sanitized once, on
+    first use."""
+    ICONS = (
+        ("<ICON ALPHA>", " α"),
+        ("<ICON BETA>", " β"),
+        ("<ICON GAMMA>", " γ"),
+    )
+
+    def __init__(self, string_table):
+        self.string_table = string_table
+        self.values = [None] * len(string_table)
+
+    def __getitem__(self, index):
+        if index < 0:
+            raise IndexError("string index out of range")
+        value = self.values[index]
+        if value is None:
+            value = self.values[index] = self.sanitize(
+                self.string_table.get(index), index)
+        return value
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def sanitize(cls, value, index):
+        if not value:
+            return f"<blank:{index}>"
+        if "<ICON" in value:
+            for tag, replacement in cls.ICONS:
+                value = value.replace(tag, replacement)
+        return value
+
+    def invalidate(self, index):
+        values = self.values
+        if index >= len(values):
+            values.extend([None] * (len(self.string_table) - len(values)))
+        values[index] = None
+
+
+def key_hash(key, repeat):
+    """CRC-32 without the final inversion (JAMCRC) of the key repeated,
+    as stored in hash_key_2x and hash_key_3x."""
+    return ~zlib.crc32(key.encode("UTF-8") * repeat) & 0xFFFFFFFF
+
+
+class GmdKeyIndex:
+    """Find info table items by key name.
+
+    Keys are looked up through the hash bucket list of the file, each
+    bucket holding the index of an info item, which chain to the other
+    items of the bucket by list_index. Files whose hashes or buckets can't
+    be reproduced for a sample of keys get a dict of all keys instead.
+    """
+    NUM_BUCKETS = 256
+    SAMPLE_SIZE = 16
+    # the hash selecting the bucket of a key, tried in order
+    BUCKET_HASHES = (2, 3)
+
+    def __init__(self, gmd):
+        self.gmd = gmd
+        self.table = gmd.info_table
+        self.buckets = list(struct.unpack_from(
+            f"<{self.NUM_BUCKETS}q", gmd.data, gmd.unknown_block.offset))
+        self.bucket_hash = self._detect_bucket_hash()
+        self.keys = None
+        if self.bucket_hash is None:
+            log.debug("gmd key hashes not reproducible, building key dict")
+            self.keys = {
+                self.key_of(index): index
+                for index in range(self.table.total_key_count)
+            }
+
+    def info(self, index):
+        return self.table.record(index)
+
+    def key_of(self, index):
+        return self.gmd.key_table[self.table.key_offset[index]]
+
+    def hashes_of(self, index):
+        return (self.table.hash_key_2x[index] & 0xFFFFFFFF,
+                self.table.hash_key_3x[index] & 0xFFFFFFFF)
+
+    def _detect_bucket_hash(self):
+        count = self.table.total_key_count
+        if not count:
+            return None
+        step = max(count // self.SAMPLE_SIZE, 1)
+        sample = range(0, count, step)
+        for index in sample:
+            key = self.key_of(index)
+            if self.hashes_of(index) != (key_hash(key, 2), key_hash(key, 3)):
+                return None
+        for repeat in self.BUCKET_HASHES:
+            if all(self._walk(self.key_of(it), repeat) == it
+                   for it in sample):
+                return repeat
+        return None
+
+    def _walk(self, key, repeat):
+        hashes = key_hash(key, 2), key_hash(key, 3)
+        bucket_hash = hashes[0] if repeat == 2 else hashes[1]
+        index = self.buckets[bucket_hash % self.NUM_BUCKETS]
+        list_indexes = self.table.list_index
+        count = self.table.total_key_count
+        # bounded, chains of broken files might loop
+        for _ in range(count):
+            if not 0 <= index < count:
+                return None
+            if self.hashes_of(index) == hashes and self.key_of(index) == key:
+                return index
+            list_index = list_indexes[index]
+            if list_index in (0, index):
+                return None
+            index = list_index
+        return None
+
+    def find(self, key):
+        """Get the index of the info item with key, or None."""
+        if self.keys is not None:
+            return self.keys.get(key)
+        return self._walk(key, self.bucket_hash)
+
+    def _bucket_of(self, index, repeat):
+        hash_2x, hash_3x = self.hashes_of(index)
+        return (hash_2x if repeat == 2 else hash_3x) % self.NUM_BUCKETS
+
+    def link(self, index):
+        """Append the info item at index to the chain of its bucket."""
+        if self.keys is not None:
+            self.keys[self.key_of(index)] = index
+        repeat = self.bucket_hash or self.BUCKET_HASHES[0]
+        bucket = self._bucket_of(index, repeat)
+        head = self.buckets[bucket]
+        # 0 marks both an empty bucket and the end of a chain
+        if head == index or (head == 0 and (
+                index == 0 or self._bucket_of(0, repeat) != bucket)):
+            self.buckets[bucket] = index
+            self.gmd.unknown_block.set_head(bucket, index)
+            return
+        list_indexes = self.table.list_index
+        tail = head
+        for _ in range(index):
+            list_index = list_indexes[tail]
+            if list_index in (0, tail) or not 0 <= list_index < index:
+                break
+            tail = list_index
+        self.table.set_list_index(tail, index)
 
 
 GmdItem = namedtuple("GmdItem", (
@@ -198,11 +561,34 @@ GmdItem = namedtuple("GmdItem", (
 ))
 
 
+class GmdItems(Sequence):
+    """Lazy sequence of the GmdItem for each info table item."""
+
+    def __init__(self, gmd):
+        self.gmd = gmd
+
+    def __len__(self):
+        return len(self.gmd.info_table)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        info = self.gmd.info_table[index]
+        return GmdItem(
+            key=self.gmd.key_table[info.key_offset],
+            value=self.gmd.string_table[info.string_index],
+            **info.as_dict())
+
+
 class Gmd:
     MAGIC = 0x00444d47
-    modified = False  # GMDs are never modifiable
 
     def __init__(self, data):
+        self.modified = False
+        self.modified_cb = None
+        self._load(data)
+
+    def _load(self, data):
         self.data = data
         self.header = GmdHeader(self, 0, data, 0)
         self.info_table = GmdInfoTable(data, self.header.total_size,
@@ -217,13 +603,30 @@ class Gmd:
                                            self.key_table.after,
                                            self.header.string_block_size,
                                            self.header.string_count)
-        self.items = [
-            GmdItem(
-                key=self.key_table[info.key_offset],
-                value=self.string_table[info.string_index],
-                **info.as_dict())
-            for info in self.info_table
-        ]
+        self.items = GmdItems(self)
+        self._key_index = None
+        self._display_strings = None
+
+    @property
+    def key_index(self):
+        if self._key_index is None:
+            self._key_index = GmdKeyIndex(self)
+        return self._key_index
+
+    @property
+    def display_strings(self):
+        if self._display_strings is None:
+            self._display_strings = GmdDisplayStrings(self.string_table)
+        return self._display_strings
+
+    def get_by_key(self, key, default=None):
+        """Get the GmdItem with key name, eg. ``IS_SKILL_XXX_NAME``."""
+        index = self.key_index.find(key)
+        if index is None:
+            return default
+        info = self.key_index.info(index)
+        return GmdItem(key=key, value=self.string_table[info.string_index],
+                       **info.as_dict())
 
     def get_string(self, index, default=None):
         try:
@@ -233,6 +636,133 @@ class Gmd:
         except IndexError:
             return default
 
+    def set_string(self, index, value):
+        if self.string_table[index] == value:
+            return
+        self.string_table.set(index, value)
+        if self._display_strings is not None:
+            self._display_strings.invalidate(index)
+        self.set_modified(True)
+
+    def add_item(self, key, value):
+        """Append a string with key name, or without a key if key is None.
+        Returns the string index."""
+        if key is not None and self.key_index.find(key) is not None:
+            raise ValueError(f"duplicate key: {key}")
+        string_index = self.string_table.append(value)
+        if key is None:
+            self.info_table.add_keyless(string_index)
+        else:
+            key_offset = self.key_table.append(key)
+            index = self.info_table.add(string_index, key_offset,
+                                        key_hash(key, 2), key_hash(key, 3))
+            self.key_index.link(index)
+        if self._display_strings is not None:
+            self._display_strings.invalidate(string_index)
+        self.set_modified(True)
+        return string_index
+
+    def set_modified(self, value):
+        modified = self.modified
+        self.modified = self.modified or value
+        if self.modified != modified and self.modified_cb:
+            self.modified_cb(value)
+
+    def clear_modified(self):
+        self.modified = False
+        if self.modified_cb:
+            self.modified_cb(self.modified)
+
+    @property
+    def size(self):
+        """Size of the serialized file, including edits."""
+        return (self.info_table.after
+                + len(self.info_table.added)
+                + GmdBucketList.SIZE
+                + self.key_table.written_size()
+                + self.string_table.written_size()
+                + len(self.data) - self.string_table.after)
+
+    def serialize(self):
+        """Build the file with all edits into one new bytearray.
+
+        Unchanged blocks and runs of unchanged strings are copied as they
+        are, so an unmodified file comes out byte for byte the same.
+        """
+        data = self.data
+        info_table = self.info_table
+        out = bytearray(self.size)
+        pos = info_table.after
+        out[:pos] = data[:pos]
+        out[pos:pos + len(info_table.added)] = info_table.added
+        pos += len(info_table.added)
+        bucket_list = self.unknown_block
+        out[pos:pos + bucket_list.SIZE] = \
+            data[bucket_list.offset:bucket_list.after]
+        pos += bucket_list.SIZE
+        key_start = pos
+        pos = self.key_table.write_block(out, pos)
+        string_start = pos
+        pos = self.string_table.write_block(out, pos)
+        out[pos:] = data[self.string_table.after:]
+        for field, value in (
+                (GmdHeader.key_count, info_table.total_key_count),
+                (GmdHeader.string_count, len(self.string_table)),
+                (GmdHeader.key_block_size, string_start - key_start),
+                (GmdHeader.string_block_size, pos - string_start)):
+            struct.pack_into("<I", out, field.offset, value)
+        return out
+
+    def detach(self):
+        """Reload from a serialized copy, which keeps the edits but no
+        longer references a memory-mapped buffer."""
+        if not isinstance(self.data, mmap.mmap):
+            return
+        mapped = self.data
+        self._load(self.serialize())
+        release_buffer(mapped)
+
+    def save(self, fp):
+        data = self.serialize()
+        fp.write(data)
+        mapped = self.data
+        self._load(data)
+        release_buffer(mapped)
+        self.clear_modified()
+
+    @classmethod
+    def probe_header(cls, header, actual_size):
+        """Validate header bytes against the total size of the file.
+
+        Only the magic is required to load a GMD, probing also flags files
+        too small to hold all the blocks the header announces.
+        """
+        if len(header) < GmdHeader.STRUCT_SIZE:
+            return ProbeResult(None, None, None, actual_size, False,
+                               f"file too small for type {cls.__name__}: "
+                               f"found {actual_size} bytes")
+        header = GmdHeader(None, 0, header, 0)
+        expected_size = (header.total_size
+                         + header.key_count * GmdInfoItem.STRUCT_SIZE
+                         + GmdBucketList.SIZE
+                         + header.key_block_size
+                         + header.string_block_size)
+        error = None
+        if header.magic != cls.MAGIC:
+            error = f"magic byte invalid: expected {cls.MAGIC:04X}, " \
+                    f"found {header.magic:04X}"
+        elif actual_size < expected_size:
+            error = f"total size invalid on type {cls.__name__}: " \
+                    f"expected {expected_size} bytes, found {actual_size}"
+        return ProbeResult(header.magic, header.string_count, expected_size,
+                           actual_size, error is None, error)
+
+    @classmethod
+    def probe(cls, path):
+        """Read only the header and size of the file at path, to identify
+        and validate it without loading it."""
+        return cls.probe_header(*read_header(path, GmdHeader.STRUCT_SIZE))
+
     @classmethod
     def check_header(cls, data):
         header = GmdHeader(None, 0, data, 0)
@@ -244,7 +774,7 @@ class Gmd:
                   header.string_count)
 
     @classmethod
-    def load(cls, fp):
-        data = bytearray(fp.read())
+    def load(cls, fp, use_mmap=False):
+        data = load_buffer(fp, use_mmap)
         cls.check_header(data)
         return cls(data)
@@ -0,0 +1,59 @@
+# coding: utf-8
+from bisect import insort
+
+
+class StructIndex:
+    """Hash index over one or more fields of the entries of a StructFile.
+
+    Maps the tuple of field values to the sorted indexes of all entries
+    having them. The StructFile refreshes entries whose indexed fields get
+    written, see StructFile.mark_dirty.
+    """
+
+    def __init__(self, struct_file, fields):
+        factory = struct_file.EntryFactory
+        self.fields = tuple(fields)
+        self._positions = tuple(factory.__field_index__[it]
+                                for it in self.fields)
+        self._spans = tuple((getattr(factory, it).offset,
+                             getattr(factory, it).after)
+                            for it in self.fields)
+        self._keys = {}
+        self._entry_keys = []
+        for index, values in enumerate(struct_file.iter_values()):
+            key = self.key_of(values)
+            self._entry_keys.append(key)
+            self._keys.setdefault(key, []).append(index)
+
+    def key_of(self, values):
+        return tuple(values[it] for it in self._positions)
+
+    def lookup(self, key):
+        return tuple(self._keys.get(key, ()))
+
+    def covers(self, start, end):
+        """Whether an indexed field overlaps the record bytes [start, end)."""
+        return any(start < span_end and span_start < end
+                   for span_start, span_end in self._spans)
+
+    def refresh(self, struct_file, index):
+        factory = struct_file.EntryFactory
+        offset = struct_file.ENTRY_OFFSET + index * factory.STRUCT_SIZE
+        values = factory.decode_record(
+            factory.__record__.unpack_from(struct_file.data, offset))
+        key = self.key_of(values)
+        old_key = self._entry_keys[index]
+        if key == old_key:
+            return
+        indexes = self._keys[old_key]
+        indexes.remove(index)
+        if not indexes:
+            del self._keys[old_key]
+        insort(self._keys.setdefault(key, []), index)
+        self._entry_keys[index] = key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"<StructIndex {self.fields} keys={len(self)}>"
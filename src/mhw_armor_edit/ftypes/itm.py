@@ -40,3 +40,4 @@ class ItmEntry(Struct):
 class Itm(StructFile):
     EntryFactory = ItmEntry
     MAGIC = 0x00BD
+    INDEXES = (("id",),)
@@ -0,0 +1,202 @@
+# coding: utf-8
+
+# bookkeeping cost of one delta beyond its bytes, counted against the budget
+DELTA_OVERHEAD = 64
+
+
+class JournalStep:
+    """One undoable step, a list of ``(offset, old_bytes, new_bytes)``."""
+    __slots__ = ("deltas", "size", "dropped")
+
+    def __init__(self):
+        self.deltas = []
+        self.size = 0
+        self.dropped = False
+
+    def add(self, offset, old_bytes, new_bytes):
+        self.deltas.append((offset, old_bytes, new_bytes))
+        self.size += len(old_bytes) + len(new_bytes) + DELTA_OVERHEAD
+
+    def drop(self):
+        self.deltas = []
+        self.size = 0
+        self.dropped = True
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def __repr__(self):
+        return f"<JournalStep deltas={len(self)} size={self.size}>"
+
+
+class Journal:
+    """Undo/redo journal of the byte-level deltas written to a StructFile.
+
+    Every write marked dirty on the file is recorded as
+    ``(offset, old_bytes, new_bytes)``. Writes inside a StructFile.batch
+    form one step, other writes one step each, where consecutive writes
+    to the same field are merged into the previous step until seal is
+    called. When the recorded steps exceed budget bytes, the oldest are
+    dropped.
+
+    clean_index is the position matching the saved file, see mark_clean,
+    or None once that position can't be reached anymore.
+
+    step_cb is called with ``(step, merged)`` after recording a step.
+    """
+
+    def __init__(self, struct_file, budget=8 * 1024 * 1024):
+        self.struct_file = struct_file
+        self.budget = budget
+        self.step_cb = None
+        self.steps = []
+        self.index = 0
+        self.size = 0
+        # whether steps were dropped to stay within budget
+        self.trimmed = False
+        self.clean_index = 0
+        self._group = None
+        self._group_depth = 0
+        self._applying = False
+        self._sealed = True
+
+    def record(self, offset, old_bytes, new_bytes):
+        if self._applying:
+            return
+        if self._group is not None:
+            self._group.add(offset, old_bytes, new_bytes)
+            return
+        if self._merge(offset, old_bytes, new_bytes):
+            return
+        step = JournalStep()
+        step.add(offset, old_bytes, new_bytes)
+        self._push(step)
+
+    def _merge(self, offset, old_bytes, new_bytes):
+        if self._sealed or self.index != len(self.steps) or not self.steps:
+            return False
+        step = self.steps[-1]
+        if len(step) != 1:
+            return False
+        last_offset, first_bytes, last_bytes = step.deltas[0]
+        if last_offset != offset or len(last_bytes) != len(new_bytes):
+            return False
+        step.deltas[0] = (offset, first_bytes, new_bytes)
+        if self.step_cb:
+            self.step_cb(step, True)
+        return True
+
+    def _push(self, step):
+        for dropped in self.steps[self.index:]:
+            self.size -= dropped.size
+            dropped.drop()
+        del self.steps[self.index:]
+        if self.clean_index is not None and self.clean_index > self.index:
+            self.clean_index = None
+        self.steps.append(step)
+        self.index = len(self.steps)
+        self.size += step.size
+        self._sealed = len(step) != 1
+        self._trim()
+        if self.step_cb:
+            self.step_cb(step, False)
+
+    def _trim(self):
+        # always keep the newest step, even if it alone exceeds the budget
+        while self.size > self.budget and len(self.steps) > 1 \
+                and self.index > 0:
+            step = self.steps.pop(0)
+            self.size -= step.size
+            self.index -= 1
+            self.trimmed = True
+            if self.clean_index is not None:
+                self.clean_index = self.clean_index - 1 \
+                    if self.clean_index else None
+            step.drop()
+
+    def begin(self):
+        """Start grouping recorded deltas into one step, may be nested."""
+        if self._group_depth == 0:
+            self._group = JournalStep()
+        self._group_depth += 1
+
+    def end(self):
+        self._group_depth -= 1
+        if self._group_depth:
+            return
+        step, self._group = self._group, None
+        if step:
+            self._push(step)
+
+    def seal(self):
+        """Prevent merging further writes into the current step, eg.
+        after the file got saved."""
+        self._sealed = True
+
+    def mark_clean(self):
+        """Remember the current position as the saved state."""
+        self.clean_index = self.index
+        self.seal()
+
+    def is_clean(self):
+        return self.index == self.clean_index
+
+    def can_undo(self):
+        return self.index > 0
+
+    def can_redo(self):
+        return self.index < len(self.steps)
+
+    def undo_step(self):
+        """Get the step undo would revert, or None."""
+        return self.steps[self.index - 1] if self.can_undo() else None
+
+    def redo_step(self):
+        """Get the step redo would reapply, or None."""
+        return self.steps[self.index] if self.can_redo() else None
+
+    def undo(self):
+        """Revert the step before the current position, return it."""
+        if not self.can_undo():
+            return None
+        self.index -= 1
+        step = self.steps[self.index]
+        self._apply(reversed(step.deltas), 1)
+        return step
+
+    def redo(self):
+        """Reapply the step after the current position, return it."""
+        if not self.can_redo():
+            return None
+        step = self.steps[self.index]
+        self.index += 1
+        self._apply(step.deltas, 2)
+        return step
+
+    def _apply(self, deltas, which):
+        struct_file = self.struct_file
+        data = struct_file.data
+        self._applying = True
+        self._sealed = True
+        try:
+            with struct_file.batch():
+                for delta in deltas:
+                    offset, payload = delta[0], delta[which]
+                    end = offset + len(payload)
+                    data[offset:end] = payload
+                    struct_file.mark_dirty(offset, end)
+        finally:
+            self._applying = False
+
+    def clear(self):
+        for step in self.steps:
+            step.drop()
+        self.steps.clear()
+        self.index = 0
+        self.size = 0
+        self.clean_index = 0
+        self._sealed = True
+
+    def __repr__(self):
+        return f"<Journal steps={len(self.steps)} index={self.index} " \
+               f"size={self.size}/{self.budget}>"
@@ -18,3 +18,4 @@ class KireEntry(Struct):
 class Kire(StructFile):
     EntryFactory = KireEntry
     MAGIC = 0x01C1
+    INDEXES = (("id",),)
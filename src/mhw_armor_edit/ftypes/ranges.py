@@ -0,0 +1,68 @@
+# coding: utf-8
+from bisect import bisect_left, bisect_right
+
+
+class RangeSet:
+    """Sorted set of disjoint half-open ``[start, end)`` integer ranges.
+
+    Overlapping or touching ranges are merged as they are added.
+    """
+
+    def __init__(self, ranges=()):
+        self._starts = []
+        self._ends = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def add(self, start, end):
+        if start >= end:
+            return
+        # ranges overlapping or touching [start, end) are contiguous in
+        # the sorted lists, from the first ending at or after start to the
+        # last starting at or before end
+        i = bisect_left(self._ends, start)
+        j = bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def clear(self):
+        self._starts.clear()
+        self._ends.clear()
+
+    def coalesced(self, gap=0):
+        """Yield ranges, joining neighbours separated by at most gap."""
+        if not self._starts:
+            return
+        start, end = self._starts[0], self._ends[0]
+        for next_start, next_end in zip(self._starts[1:], self._ends[1:]):
+            if next_start - end <= gap:
+                end = next_end
+            else:
+                yield start, end
+                start, end = next_start, next_end
+        yield start, end
+
+    @property
+    def size(self):
+        """Total number of integers covered."""
+        return sum(end - start for start, end in self)
+
+    def __contains__(self, value):
+        i = bisect_right(self._starts, value) - 1
+        return i >= 0 and value < self._ends[i]
+
+    def __iter__(self):
+        return zip(self._starts, self._ends)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __bool__(self):
+        return bool(self._starts)
+
+    def __repr__(self):
+        ranges = ", ".join(f"[{start}, {end})" for start, end in self)
+        return f"<RangeSet {ranges}>"
@@ -0,0 +1,304 @@
+# coding: utf-8
+import re
+from collections.abc import Sequence
+
+import numpy as np
+
+FORMAT_TYPES = {
+    "b": "i1",
+    "B": "u1",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "l": "<i4",
+    "L": "<u4",
+    "q": "<i8",
+    "Q": "<u8",
+    "f": "<f4",
+    "d": "<f8",
+}
+FORMAT_PATTERN = re.compile(r"^[@=<>!]?(\d*)([a-zA-Z?])$")
+_dtypes = {}
+
+
+def field_dtype(fmt):
+    """Translate a single-item struct format (eg. "<H", "<4B") to numpy."""
+    match = FORMAT_PATTERN.match(fmt)
+    if match is None or match.group(2) not in FORMAT_TYPES:
+        raise ValueError(f"unsupported struct format {fmt!r}")
+    count, code = match.groups()
+    if count and int(count) != 1:
+        return FORMAT_TYPES[code], (int(count),)
+    return FORMAT_TYPES[code]
+
+
+def entry_dtype(entry_cls):
+    """Get the structured dtype for the record layout of a Struct class."""
+    dtype = _dtypes.get(entry_cls)
+    if dtype is None:
+        fields = [getattr(entry_cls, name) for name in entry_cls.__fields__]
+        dtype = np.dtype({
+            "names": list(entry_cls.__fields__),
+            "formats": [field_dtype(field.fmt) for field in fields],
+            "offsets": [field.offset for field in fields],
+            "itemsize": entry_cls.STRUCT_SIZE,
+        })
+        _dtypes[entry_cls] = dtype
+    return dtype
+
+
+class StructArray:
+    """Zero-copy structured array view over the entries of a StructFile.
+
+    Reads return read-only numpy views. Writes have to go through item
+    assignment, so the owning file gets flagged as modified::
+
+        array["rarity"] = 10
+        array["raw_damage", array["rarity"] == 12] = 300
+
+    For range checked bulk assignments see set_column and update_column.
+    """
+    OPERATIONS = {
+        "add": np.add,
+        "sub": np.subtract,
+        "mul": np.multiply,
+        "div": np.true_divide,
+    }
+
+    def __init__(self, parent, array):
+        self.parent = parent
+        self._array = array
+        self._readonly = array.view()
+        self._readonly.flags.writeable = False
+
+    @classmethod
+    def from_file(cls, struct_file):
+        array = np.frombuffer(
+            struct_file.data,
+            dtype=entry_dtype(struct_file.EntryFactory),
+            count=struct_file.num_entries,
+            offset=struct_file.ENTRY_OFFSET)
+        return cls(struct_file, array)
+
+    @property
+    def dtype(self):
+        return self._array.dtype
+
+    @property
+    def fields(self):
+        return self._array.dtype.names
+
+    @property
+    def values(self):
+        return self._readonly
+
+    def __len__(self):
+        return len(self._array)
+
+    def __iter__(self):
+        return iter(self._readonly)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            field, rows = key
+            return self._readonly[field][rows]
+        return self._readonly[key]
+
+    def _target(self, key):
+        if isinstance(key, tuple):
+            field, rows = key
+            return self._array[field], rows
+        return self._array, key
+
+    def _written(self, key):
+        """Get the entry indexes and the byte span within their records
+        written by an item assignment to key."""
+        field, rows = key if isinstance(key, tuple) else (None, key)
+        if isinstance(rows, str):
+            field, rows = rows, slice(None)
+        if isinstance(rows, tuple):
+            rows = rows[0]
+        if isinstance(rows, slice):
+            indexes = np.arange(*rows.indices(len(self)))
+        else:
+            rows = np.asarray(rows)
+            if rows.dtype == bool:
+                indexes = np.flatnonzero(rows)
+            else:
+                indexes = np.unique(np.where(rows < 0, rows + len(self), rows))
+        if field is None:
+            return indexes, 0, self.dtype.itemsize
+        dtype, start = self.dtype.fields[field][:2]
+        return indexes, start, start + dtype.itemsize
+
+    def __setitem__(self, key, value):
+        target, rows = self._target(key)
+        indexes, start, end = self._written(key)
+        size = self.dtype.itemsize
+        records = self._array.view(np.uint8).reshape(len(self), size)
+        # only the bytes written are compared, fancy indexing copies them
+        before = records[indexes, start:end]
+        target[rows] = value
+        changed = np.flatnonzero(
+            (before != records[indexes, start:end]).any(axis=1))
+        offset = self.parent.ENTRY_OFFSET + start
+        with self.parent.batch():
+            for row, index in zip(changed.tolist(),
+                                  indexes[changed].tolist()):
+                record_start = offset + index * size
+                self.parent.mark_dirty(record_start,
+                                       record_start + end - start,
+                                       before[row].tobytes())
+
+    def rows(self, where=None):
+        """Resolve where (None, a boolean mask, entry indexes, a Query or a
+        QueryResult) to entry indexes."""
+        if where is None:
+            return np.arange(len(self))
+        if isinstance(where, Query):
+            where = where.mask(self)
+        elif isinstance(where, QueryResult):
+            return where.indexes
+        where = np.asarray(where)
+        if where.dtype == bool:
+            return np.flatnonzero(where)
+        return where
+
+    def set_column(self, field, values, where=None, overflow="raise"):
+        """Assign a scalar or one value per selected row to a field.
+
+        Float values are rounded to the nearest integer for integer
+        fields. Values out of range for an integer field raise ValueError,
+        or with overflow="clamp" are clamped to the range.
+        """
+        dtype = self.dtype.fields[field][0]
+        if dtype.subdtype is not None:
+            raise ValueError(f"can't assign multi-value field {field!r}")
+        rows = self.rows(where)
+        values = np.broadcast_to(np.asarray(values), rows.shape)
+        if dtype.kind in "iu":
+            if values.dtype.kind == "f":
+                values = np.rint(values)
+            limits = np.iinfo(dtype)
+            out_of_range = (values < limits.min) | (values > limits.max)
+            if out_of_range.any():
+                if overflow == "clamp":
+                    values = np.clip(values, limits.min, limits.max)
+                else:
+                    raise ValueError(
+                        f"{np.count_nonzero(out_of_range)} values out of "
+                        f"range [{limits.min}, {limits.max}] for {field!r}")
+        with self.parent.batch():
+            self[field, rows] = values.astype(dtype)
+        return len(rows)
+
+    def update_column(self, field, op, operand, where=None, overflow="raise"):
+        """Apply arithmetic to a field, eg. ``("mul", 1.1)``, see
+        set_column."""
+        if op not in self.OPERATIONS:
+            raise ValueError(f"unknown operation {op!r}")
+        rows = self.rows(where)
+        current = self._readonly[field][rows]
+        if current.dtype.kind in "iu" \
+                and not isinstance(operand, float) and op != "div":
+            current = current.astype(np.int64)
+        else:
+            current = current.astype(np.float64)
+        values = self.OPERATIONS[op](current, operand)
+        return self.set_column(field, values, rows, overflow)
+
+    def __repr__(self):
+        return f"<StructArray {self.parent.__class__.__name__} " \
+               f"entries={len(self)}>"
+
+
+class Query:
+    """Field conditions compiled to vectorized comparisons.
+
+    Conditions are keyword arguments ``<field>__<op>=<value>``, the op
+    defaults to ``eq``. All conditions have to match::
+
+        Query(rarity__ge=10, element_id=3, num_gem_slots=3)
+
+    A Query is independent of any file, so the same one can be applied to
+    many files, eg. every ``*.wp_dat``.
+    """
+    OPERATORS = {
+        "eq": np.equal,
+        "ne": np.not_equal,
+        "lt": np.less,
+        "le": np.less_equal,
+        "gt": np.greater,
+        "ge": np.greater_equal,
+        "in": lambda column, value: np.isin(column, list(value)),
+        "has": lambda column, value: (column & value) == value,
+    }
+
+    def __init__(self, **conditions):
+        self.conditions = []
+        for key, value in conditions.items():
+            field, _, op = key.partition("__")
+            op = op or "eq"
+            if op not in self.OPERATORS:
+                raise ValueError(f"unknown query operator {op!r} in {key!r}")
+            self.conditions.append((field, op, value))
+
+    def mask(self, array):
+        """Get the boolean row mask of the entries matching all conditions."""
+        values = array.values
+        result = np.ones(len(values), dtype=bool)
+        for field, op, value in self.conditions:
+            if field not in values.dtype.names:
+                raise KeyError(f"unknown field {field!r}")
+            column = values[field]
+            if column.ndim != 1:
+                raise ValueError(f"can't query multi-value field {field!r}")
+            result &= self.OPERATORS[op](column, value)
+        return result
+
+    def __call__(self, struct_file):
+        return QueryResult(
+            struct_file, np.flatnonzero(self.mask(struct_file.as_array())))
+
+    def __repr__(self):
+        conditions = ", ".join(f"{field}__{op}={value!r}"
+                               for field, op, value in self.conditions)
+        return f"<Query {conditions}>"
+
+
+class QueryResult(Sequence):
+    """Entries of a StructFile selected by a query.
+
+    Holds only the entry indexes, entries are created on access.
+    """
+
+    def __init__(self, struct_file, indexes):
+        self.struct_file = struct_file
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return QueryResult(self.struct_file, self.indexes[index])
+        return self.struct_file.entries[self.indexes[index]]
+
+    def __iter__(self):
+        entries = self.struct_file.entries
+        for index in self.indexes.tolist():
+            yield entries[index]
+
+    @property
+    def mask(self):
+        result = np.zeros(self.struct_file.num_entries, dtype=bool)
+        result[self.indexes] = True
+        return result
+
+    def column(self, field):
+        return self.struct_file.column(field)[self.indexes]
+
+    def __repr__(self):
+        return f"<QueryResult {self.struct_file.__class__.__name__} " \
+               f"matches={len(self)}>"
@@ -47,3 +47,4 @@ class WpDatEntry(Struct):
 class WpDat(StructFile):
     EntryFactory = WpDatEntry
     MAGIC = 0x01C1
+    INDEXES = (("id",),)
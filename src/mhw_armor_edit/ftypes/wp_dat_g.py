@@ -51,3 +51,4 @@ class WpDatGEntry(Struct):
 class WpDatG(StructFile):
     EntryFactory = WpDatGEntry
     MAGIC = 0x021D
+    INDEXES = (("id",),)
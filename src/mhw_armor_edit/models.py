@@ -2,17 +2,111 @@
 import errno
 import logging
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from PyQt5.QtCore import (QObject, pyqtSignal)
+from PyQt5.QtCore import (QObject, pyqtSignal, QTimer, Qt,
+                          QFileSystemWatcher)
+from PyQt5.QtWidgets import QUndoCommand, QUndoStack
 
 from mhw_armor_edit.editor.models import FilePluginRegistry
+from mhw_armor_edit.ftypes.journal import Journal
+from mhw_armor_edit.ftypes.ranges import RangeSet
 
 log = logging.getLogger()
 
 
+def read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once at startup, setting the umask affects all threads
+UMASK = read_umask()
+
+
+def copy_mode(src, dst):
+    """Give dst the permissions of src, or of a new file if src doesn't
+    exist, as mkstemp creates files only the owner can read."""
+    try:
+        shutil.copymode(src, dst)
+    except FileNotFoundError:
+        os.chmod(dst, 0o666 & ~UMASK)
+
+
+class JournalCommand(QUndoCommand):
+    """Undo command for one journal step of a WorkspaceFile.
+
+    The step is already applied when the command gets pushed. The command
+    only applies its own step, it becomes obsolete when that step isn't
+    next in the journal anymore.
+    """
+
+    def __init__(self, ws_file, step):
+        super().__init__(f"Edit {ws_file.rel_path}")
+        self.ws_file = ws_file
+        self.journal = ws_file.journal
+        self.step = step
+        self.applied = True
+
+    def redo(self):
+        if self.applied:
+            return
+        self.apply(self.journal.redo_step(), self.journal.redo)
+        self.applied = True
+
+    def undo(self):
+        self.apply(self.journal.undo_step(), self.journal.undo)
+        self.applied = False
+
+    def apply(self, next_step, func):
+        # the step was dropped from the journal to stay within its budget,
+        # the file was reloaded, or the step was made from another stack
+        if self.step.dropped or self.journal is not self.ws_file.journal \
+                or next_step is not self.step:
+            self.setObsolete(True)
+            return
+        func()
+        self.ws_file.handle_journal_moved()
+
+
+class ChangeSet:
+    """Data ranges written to a WorkspaceFile and its relations within one
+    event loop tick, keyed by the data object written to."""
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __contains__(self, data):
+        return data in self.ranges
+
+    def __iter__(self):
+        return iter(self.ranges)
+
+    def entry_fields(self, data):
+        """Map entry index to the names of changed fields of data."""
+        ranges = self.ranges.get(data)
+        if ranges is None:
+            return {}
+        return data.fields_in_ranges(ranges)
+
+    def __repr__(self):
+        return f"<ChangeSet {self.ranges!r}>"
+
+
 class WorkspaceFile(QObject):
     modifiedChanged = pyqtSignal(bool)
+    # ChangeSet of writes to this file and its relations, coalesced
+    # to at most one emit per event loop tick
+    changed = pyqtSignal(object)
     reloaded = pyqtSignal()
+    # byte budget of the undo journal of each file
+    undo_budget = 8 * 1024 * 1024
 
     def __init__(self, directory, rel_path, data=None, parent=None):
         super().__init__(parent)
@@ -22,6 +116,18 @@ class WorkspaceFile(QObject):
         self.data = data
         self.relations = {}
         self.attrs = {}
+        self.synced_stat = None
+        self.journal = None
+        self.undo_stack = None
+        self.set_undo_stack(QUndoStack(self))
+        # files having this one as relation
+        self.dependents = []
+        self.is_modified = False
+        self._pending = {}
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self.flush_changes)
 
     def set_attrs(self, attrs):
         self.attrs.update(attrs)
@@ -31,7 +137,28 @@ class WorkspaceFile(QObject):
 
     def add_relation(self, key, ws_file):
         self.relations[key] = ws_file
-        self.relations[key].modified_cb = self.handle_modified
+        ws_file.dependents.append(self)
+        # relation edits are undone with the first file using it, keeping
+        # all steps of a shared relation on one stack, in order
+        if len(ws_file.dependents) == 1:
+            ws_file.set_undo_stack(self.undo_stack)
+        ws_file.reloaded.connect(self.reloaded)
+
+    def remove_relation(self, key):
+        ws_file = self.relations.pop(key, None)
+        if ws_file is None:
+            return
+        ws_file.dependents.remove(self)
+        ws_file.reloaded.disconnect(self.reloaded)
+        if ws_file.undo_stack is self.undo_stack:
+            # hand further edits to another file using the relation
+            ws_file.set_undo_stack(ws_file.dependents[0].undo_stack
+                                   if ws_file.dependents
+                                   else QUndoStack(ws_file))
+
+    def clear_relations(self):
+        for key in list(self.relations):
+            self.remove_relation(key)
 
     def get_relation_data(self, key):
         rel = self.relations.get(key)
@@ -42,10 +169,69 @@ class WorkspaceFile(QObject):
     def set_data(self, data):
         self.data = data
         self.data.modified_cb = self.handle_modified
+        self.data.changed_cb = self.handle_data_changed
+        self.journal = None
+        if hasattr(data, "journal"):
+            self.journal = Journal(data, self.undo_budget)
+            self.journal.step_cb = self.handle_journal_step
+            data.journal = self.journal
+        self.drop_undo_commands()
         self.reloaded.emit()
 
+    def drop_undo_commands(self):
+        # a shared stack keeps the commands of the other files, the ones
+        # of this file became obsolete with the journal they were made for
+        stack = self.undo_stack
+        if all(getattr(stack.command(i), "ws_file", None) is self
+               for i in range(stack.count())):
+            stack.clear()
+
+    def set_undo_stack(self, undo_stack):
+        self.undo_stack = undo_stack
+
+    def handle_journal_step(self, step, merged):
+        if not merged:
+            self.undo_stack.push(JournalCommand(self, step))
+
+    def handle_journal_moved(self):
+        # back at the saved state of this file, the undo stack might be
+        # shared with files saved at other times
+        if self.journal.is_clean() and self.data.modified:
+            self.data.clear_modified()
+
     def handle_modified(self, modified):
-        self.modifiedChanged.emit(modified)
+        self.notify_changed(self.data)
+
+    def handle_data_changed(self, start, end):
+        self.notify_changed(self.data, start, end)
+
+    def notify_changed(self, data, start=None, end=None):
+        """Collect a change of data (this file's or a relation's) for the
+        next flush_changes, then pass it on to dependent files."""
+        ranges = self._pending.setdefault(data, RangeSet())
+        if start is not None:
+            ranges.add(start, end)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+        for dependent in self.dependents:
+            dependent.notify_changed(data, start, end)
+
+    def flush_changes(self):
+        self._flush_timer.stop()
+        pending, self._pending = self._pending, {}
+        is_modified = any(it.data.modified for it in self.get_files())
+        if is_modified != self.is_modified:
+            self.is_modified = is_modified
+            self.modifiedChanged.emit(is_modified)
+        changes = ChangeSet({data: ranges for data, ranges in pending.items()
+                             if ranges})
+        if changes:
+            self.changed.emit(changes)
+
+    def get_files(self):
+        files = [self, ]
+        files.extend(self.relations.values())
+        return files
 
     def set_directory(self, directory):
         self.directory = directory
@@ -60,10 +246,48 @@ class WorkspaceFile(QObject):
             if rel.data.modified)
         return files
 
+    def mark_synced(self):
+        """Remember the on-disk state matching the data, which is what
+        lets save patch only the dirty ranges into the file."""
+        stat = os.stat(self.abs_path)
+        self.synced_stat = (self.abs_path, stat.st_size, stat.st_mtime_ns)
+
+    def is_synced(self):
+        if self.synced_stat is None:
+            return False
+        try:
+            stat = os.stat(self.abs_path)
+        except OSError:
+            return False
+        return self.synced_stat == (self.abs_path, stat.st_size,
+                                    stat.st_mtime_ns)
+
     def save(self):
         self.directory.ensure_dirs(self.rel_path)
-        with open(self.abs_path, "wb") as fp:
-            self.data.save(fp)
+        dirty = getattr(self.data, "dirty", None)
+        if dirty is not None and self.is_synced():
+            with open(self.abs_path, "r+b") as fp:
+                self.data.save_dirty(fp)
+        else:
+            self.save_atomic()
+        self.mark_synced()
+        if self.journal is not None:
+            self.journal.mark_clean()
+
+    def save_atomic(self):
+        # the file might be mapped, copy it before replacing it
+        self.data.detach()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.abs_path),
+            prefix=os.path.basename(self.abs_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                self.data.save(fp)
+            copy_mode(self.abs_path, tmp_path)
+            os.replace(tmp_path, self.abs_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
 
     def __repr__(self):
         return f"<WorkspaceFile {self.abs_path}>"
@@ -73,13 +297,16 @@ class WorkspaceFile(QObject):
 
 
 class Directory(QObject):
+    """A root directory of game files. Files in it may be mapped when it
+    has use_mmap set, see FilePluginRegistry.can_map."""
     changed = pyqtSignal(str)
 
-    def __init__(self, name, file_icon, path, parent=None):
+    def __init__(self, name, file_icon, path, use_mmap=False, parent=None):
         super().__init__(parent)
         self.name = name
         self.file_icon = file_icon
         self.path = path
+        self.use_mmap = use_mmap
 
     def __repr__(self):
         return f"<Directory {self.name}: {self.path}>"
@@ -110,32 +337,247 @@ class Directory(QObject):
                 raise
 
 
+class FileWatcher(QObject):
+    """Watch files for changes on disk.
+
+    Files are watched with QFileSystemWatcher (inotify on Linux), those
+    it can't watch, eg. on some network drives or while deleted, are
+    polled instead. fileChanged is emitted once the size or mtime of a
+    file changed and then settled, as tools often write files in several
+    steps.
+    """
+    fileChanged = pyqtSignal(str)
+    SETTLE_DELAY = 200
+    POLL_INTERVAL = 2000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.handle_file_changed)
+        # last seen size and mtime by path
+        self.stats = dict()
+        self.polled = set()
+        self.changed = set()
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(self.SETTLE_DELAY)
+        self.settle_timer.timeout.connect(self.check_changed)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self.poll)
+
+    @staticmethod
+    def get_stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def set_paths(self, paths):
+        paths = set(paths)
+        for path in set(self.stats) - paths:
+            self.remove_path(path)
+        for path in paths - set(self.stats):
+            self.add_path(path)
+
+    def add_path(self, path):
+        self.stats[path] = self.get_stat(path)
+        self.watch(path)
+
+    def remove_path(self, path):
+        del self.stats[path]
+        self.changed.discard(path)
+        if path in self.watcher.files():
+            self.watcher.removePath(path)
+        self.polled.discard(path)
+        self.update_poll_timer()
+
+    def watch(self, path):
+        self.polled.discard(path)
+        if path not in self.watcher.files() \
+                and not (os.path.exists(path) and self.watcher.addPath(path)):
+            self.polled.add(path)
+        self.update_poll_timer()
+
+    def update_poll_timer(self):
+        if not self.polled:
+            self.poll_timer.stop()
+        elif not self.poll_timer.isActive():
+            self.poll_timer.start()
+
+    def handle_file_changed(self, path):
+        self.changed.add(path)
+        # restarted while the file is still being written
+        self.settle_timer.start()
+
+    def poll(self):
+        changed = [path for path in self.polled
+                   if self.get_stat(path) != self.stats[path]]
+        self.changed.update(changed)
+        if changed and not self.settle_timer.isActive():
+            self.settle_timer.start()
+
+    def check_changed(self):
+        changed, self.changed = self.changed, set()
+        for path in sorted(changed):
+            if path not in self.stats:
+                continue
+            # a replaced file is still watched while it's open, eg. mapped
+            if path in self.watcher.files():
+                self.watcher.removePath(path)
+            self.watch(path)
+            stat = self.get_stat(path)
+            if stat == self.stats[path]:
+                continue
+            self.stats[path] = stat
+            if stat is not None:
+                self.fileChanged.emit(path)
+
+
+class FileLoad:
+    """A file being loaded with its relations, futures maps the absolute
+    paths of the files read on the worker pool to their futures."""
+
+    def __init__(self, directory, abs_path, rel_path):
+        self.directory = directory
+        self.abs_path = abs_path
+        self.rel_path = rel_path
+        self.futures = {}
+
+    def done(self):
+        return all(it.done() for it in self.futures.values())
+
+    def __repr__(self):
+        return f"<FileLoad {self.abs_path} files={len(self.futures)}>"
+
+
 class Workspace(QObject):
     fileOpened = pyqtSignal(str, str)
     fileActivated = pyqtSignal(str, str)
     fileClosed = pyqtSignal(str, str)
     fileLoadError = pyqtSignal(str, str, str)
+    # an open file with unsaved edits changed on disk
+    fileConflict = pyqtSignal(str, str)
+    # number of files read and to read by loads in progress
+    loadProgress = pyqtSignal(int, int)
+    # a future of a FileLoad finished, emitted from worker threads
+    _futureDone = pyqtSignal(object)
+    max_workers = min(8, os.cpu_count() or 1)
 
     def __init__(self, directories, parent=None):
         super().__init__(parent)
         self.directories = directories
         self.files = dict()
+        # loads in progress by absolute path
+        self.loads = dict()
+        # futures by absolute path of the file read and whether it's read
+        # as relation, shared between loads
+        self.pending = dict()
+        self.executor = ThreadPoolExecutor(self.max_workers)
+        self._futureDone.connect(self.handle_future_done, Qt.QueuedConnection)
+        self.watcher = FileWatcher(self)
+        self.watcher.fileChanged.connect(self.handle_file_changed)
+
+    @property
+    def is_loading(self):
+        return bool(self.loads)
 
     def open_file(self, directory, abs_path):
+        """Start loading the file and its relations on the worker pool,
+        fileOpened or fileLoadError is emitted when done."""
         abs_path = os.path.normpath(abs_path)
         rel_path = directory.get_child_rel_path(abs_path)
         if abs_path in self.files:
             self.fileActivated.emit(abs_path, rel_path)
-        else:
-            try:
-                ws_file = WorkspaceFile(directory, rel_path, parent=self)
-                FilePluginRegistry.load_model(ws_file)
-                FilePluginRegistry.load_relations(ws_file, self.directories)
-                self.files[abs_path] = ws_file
-                self.fileOpened.emit(abs_path, rel_path)
-            except Exception as e:
-                log.exception("error loading path: %s", abs_path)
-                self.fileLoadError.emit(abs_path, rel_path, str(e))
+            return
+        if abs_path in self.loads:
+            return
+        load = FileLoad(directory, abs_path, rel_path)
+        self.loads[abs_path] = load
+        self.add_future(load, abs_path, self.submit(directory, abs_path,
+                                                    False))
+        self.submit_relations(load)
+        self.emit_load_progress()
+
+    def submit_relations(self, load):
+        """Read the relations of load which aren't cached, or not anymore,
+        return whether any was submitted."""
+        submitted = False
+        relations = FilePluginRegistry.find_relations(
+            load.rel_path, self.directories)
+        for rel_directory, relation_rpath in relations.values():
+            relation_path, _ = rel_directory.get_child_path(relation_rpath)
+            relation_path = os.path.normpath(relation_path)
+            if relation_path in load.futures or \
+                    FilePluginRegistry.relation_cache.lookup(relation_path):
+                continue
+            self.add_future(load, relation_path, self.submit(
+                rel_directory, relation_path, True))
+            submitted = True
+        return submitted
+
+    def add_future(self, load, abs_path, future):
+        load.futures[abs_path] = future
+        future.add_done_callback(
+            lambda _, load=load: self._futureDone.emit(load))
+
+    def submit(self, directory, abs_path, is_relation):
+        # the data of relations is shared, opened files get their own
+        key = (abs_path, is_relation)
+        future = self.pending.get(key)
+        if future is None or future.cancelled():
+            future = self.executor.submit(
+                FilePluginRegistry.load_data, abs_path,
+                FilePluginRegistry.can_map(directory, abs_path, is_relation))
+            self.pending[key] = future
+        return future
+
+    def handle_future_done(self, load):
+        if self.loads.get(load.abs_path) is not load:
+            return
+        # relations cached when the load started might have been evicted
+        # since, read them too instead of on the GUI thread
+        if load.done() and not self.submit_relations(load):
+            self.finish_load(load)
+        self.emit_load_progress()
+
+    def finish_load(self, load):
+        del self.loads[load.abs_path]
+        self.pending = {
+            key: future for key, future in self.pending.items()
+            if any(it.futures.get(key[0]) is future
+                   for it in self.loads.values())
+        }
+        abs_path, rel_path = load.abs_path, load.rel_path
+        try:
+            datas = {path: future.result()
+                     for path, future in load.futures.items()}
+            ws_file = WorkspaceFile(load.directory, rel_path, parent=self)
+            FilePluginRegistry.load_model(ws_file, data=datas.pop(abs_path))
+            FilePluginRegistry.load_relations(ws_file, self.directories,
+                                              datas)
+            self.files[abs_path] = ws_file
+            self.update_watched()
+            self.fileOpened.emit(abs_path, rel_path)
+        except Exception as e:
+            log.exception("error loading path: %s", abs_path)
+            self.fileLoadError.emit(abs_path, rel_path, str(e))
+
+    def emit_load_progress(self):
+        futures = self.pending.values()
+        self.loadProgress.emit(sum(it.done() for it in futures),
+                               len(futures))
+
+    def cancel_loading(self):
+        """Cancel all loads in progress, files already being read are
+        discarded when done."""
+        for load in self.loads.values():
+            for future in load.futures.values():
+                future.cancel()
+        self.loads.clear()
+        self.pending.clear()
+        self.emit_load_progress()
 
     def open_file_any_dir(self, rel_path):
         for directory in self.directories:
@@ -146,6 +588,62 @@ class Workspace(QObject):
     def close_file(self, ws_file):
         try:
             self.files.pop(ws_file.abs_path)
+            relations = list(ws_file.relations.values())
+            ws_file.clear_relations()
+            FilePluginRegistry.relation_cache.release(relations)
+            self.update_watched()
             self.fileClosed.emit(ws_file.abs_path, ws_file.rel_path)
         except (ValueError, KeyError):
             log.exception("error while closing file %s", ws_file)
+
+    def reload_translations(self):
+        """Switch the translations of all open files to the current
+        language, see FilePluginRegistry.lang."""
+        for ws_file in self.files.values():
+            FilePluginRegistry.load_translations(ws_file, self.directories)
+            ws_file.reloaded.emit()
+            # the translations switched from might have been modified
+            ws_file.notify_changed(ws_file.data)
+        self.update_watched()
+
+    def get_watched_files(self):
+        """Map absolute paths to the open files and relations there. A
+        file open on its own and as relation has two WorkspaceFiles."""
+        result = {}
+        for ws_file in self.files.values():
+            for it in ws_file.get_files():
+                files = result.setdefault(os.path.normpath(it.abs_path), [])
+                if it not in files:
+                    files.append(it)
+        return result
+
+    def update_watched(self):
+        self.watcher.set_paths(self.get_watched_files())
+
+    def handle_file_changed(self, abs_path):
+        # saving changes the file too, but leaves it synced
+        ws_files = [it for it in self.get_watched_files().get(abs_path, ())
+                    if not it.is_synced()]
+        if not ws_files:
+            return
+        modified = [it for it in ws_files if it.data.modified]
+        if modified:
+            self.fileConflict.emit(abs_path, modified[0].rel_path)
+        else:
+            self.reload_file(abs_path)
+
+    def reload_file(self, abs_path):
+        """Reload the open files and relations at abs_path from disk,
+        discarding their unsaved edits. Only the editors using them are
+        reloaded."""
+        opened = set(self.files.values())
+        for ws_file in self.get_watched_files().get(abs_path, ()):
+            try:
+                FilePluginRegistry.load_model(ws_file,
+                                              ws_file not in opened)
+            except Exception as e:
+                log.exception("error reloading path: %s", abs_path)
+                self.fileLoadError.emit(abs_path, ws_file.rel_path, str(e))
+                continue
+            # dependents might not be modified anymore
+            ws_file.notify_changed(ws_file.data)
@@ -8,6 +8,7 @@ from PyQt5.QtWidgets import (QTableView, QLineEdit, QAction, QHeaderView,
                              QTreeView, QAbstractItemView, QApplication, QMenu,
                              QStyle)
 
+from mhw_armor_edit.ftypes import StructEntries
 from mhw_armor_edit.import_export import (ImportExportManager)
 from mhw_armor_edit.utils import create_action
 
@@ -208,6 +209,18 @@ class StructTableModel(QAbstractTableModel):
     def columnCount(self, parent=None, *args, **kwargs):
         return len(self.fields)
 
+    def handle_changes(self, changes):
+        """Emit dataChanged for the cells of changed entry fields."""
+        if not isinstance(self.entries, StructEntries):
+            return
+        entry_fields = changes.entry_fields(self.entries.parent)
+        columns = {field: i for i, field in enumerate(self.fields)}
+        for row, fields in entry_fields.items():
+            changed = [columns[it] for it in fields if it in columns]
+            if changed and row < len(self.entries):
+                self.dataChanged.emit(self.index(row, min(changed)),
+                                      self.index(row, max(changed)))
+
     def get_field_value(self, entry, field):
         return getattr(entry, field)
 
@@ -258,13 +271,8 @@ class StructTableModel(QAbstractTableModel):
         if not self.entries:
             yield None
             return
-        for item in self.entries:
-            attrs_match = all(
-                getattr(item, key, None) == value
-                for key, value in attrs.items()
-            )
-            if attrs_match:
-                yield item
+        for i in self.index_of(**attrs):
+            yield self.entries[i]
 
     def find_first(self, **attrs):
         for result in self.find(**attrs):
@@ -274,6 +282,9 @@ class StructTableModel(QAbstractTableModel):
         if not self.entries:
             yield None
             return
+        if isinstance(self.entries, StructEntries):
+            yield from self.entries.parent.find_indexes(**attrs)
+            return
         for i, item in enumerate(self.entries):
             attrs_match = all(
                 getattr(item, key, None) == value
@@ -285,3 +296,9 @@ class StructTableModel(QAbstractTableModel):
     def index_of_first(self, **attrs):
         for result in self.index_of(**attrs):
             return result
+
+    def index_of_last(self, **attrs):
+        result = None
+        for result in self.index_of(**attrs):
+            pass
+        return result
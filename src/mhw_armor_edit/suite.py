@@ -1,5 +1,6 @@
 # coding: utf-8
 import logging
+import multiprocessing
 import os
 import sys
 from contextlib import contextmanager
@@ -8,16 +9,20 @@ from functools import partial
 from PyQt5.QtCore import Qt, QSize, QPoint, QModelIndex
 from PyQt5.QtGui import QKeySequence, QIcon, QTextDocument
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileSystemModel,
-                             QTreeView, QStyle,
+                             QTreeView, QStyle, QAbstractItemView,
                              QFileDialog, QTabWidget, QBoxLayout,
                              QWidget, QMessageBox, QDockWidget, QLabel,
                              QVBoxLayout, QLineEdit, QStatusBar, QDialog,
-                             QTextBrowser)
+                             QTextBrowser, QUndoGroup, QProgressBar,
+                             QToolButton)
 
 from mhw_armor_edit.assets import Assets
+from mhw_armor_edit.editor.gmd_editor import GmdTableEditor
 from mhw_armor_edit.editor.models import FilePluginRegistry
 from mhw_armor_edit.import_export import ExportDialog, ImportDialog
 from mhw_armor_edit.models import Workspace, Directory
+from mhw_armor_edit.struct_table import StructTableModel
+from mhw_armor_edit.text_search import TextSearchWidget
 from mhw_armor_edit.utils import create_action, AppSettings
 
 STATUSBAR_MESSAGE_TIMEOUT = 10 * 1000
@@ -186,6 +191,17 @@ class EditorView(QWidget):
         self.workspace_file.modifiedChanged.connect(
             self.handle_workspace_file_modified_changed
         )
+        self.workspace_file.changed.connect(
+            self.handle_workspace_file_changed
+        )
+
+    def handle_workspace_file_changed(self, changes):
+        for model in self.findChildren(StructTableModel):
+            model.handle_changes(changes)
+        # other models derive their cells from several entries and
+        # relations, repainting requests the visible ones again
+        for view in self.findChildren(QAbstractItemView):
+            view.viewport().update()
 
     def handle_workspace_file_modified_changed(self, modified):
         tab_widget = self.parent().parent()
@@ -247,9 +263,10 @@ class HelpWidget(QTextBrowser):
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
+        # the game files, other tools don't change them
         self.chunk_directory = Directory(
             "CHUNK", QIcon(Assets.get_asset_path("document_a4_locked.png")),
-            None)
+            None, use_mmap=True)
         self.mod_directory = Directory(
             "MOD", QIcon(Assets.get_asset_path("document_a4.png")),
             None)
@@ -259,16 +276,25 @@ class MainWindow(QMainWindow):
         self.workspace.fileClosed.connect(self.handle_workspace_file_closed)
         self.workspace.fileActivated.connect(self.handle_workspace_file_activated)
         self.workspace.fileLoadError.connect(self.handle_workspace_file_load_error)
+        self.workspace.loadProgress.connect(self.handle_workspace_load_progress)
+        self.workspace.fileConflict.connect(self.handle_workspace_file_conflict)
+        # paths of files with a conflict prompt open
+        self.file_conflicts = set()
+        # string to select in a GMD once opened, see text search
+        self.pending_string_selection = None
+        self.undo_group = QUndoGroup(self)
         self.init_actions()
         self.init_menu_bar()
         self.init_toolbar()
         self.setStatusBar(QStatusBar())
+        self.init_load_progress()
         self.setWindowTitle("MHW-Editor-Suite")
         self.init_file_tree(self.chunk_directory, "Chunk directory",
                             self.open_chunk_directory_action, filtered=True)
         self.init_file_tree(self.mod_directory, "Mod directory",
                             self.open_mod_directory_action)
         self.init_help()
+        self.init_text_search()
         self.setCentralWidget(self.init_editor_tabs())
         self.load_settings()
 
@@ -341,6 +367,16 @@ class MainWindow(QMainWindow):
             "Import file ...",
             self.handle_import_file_action)
         self.import_action.setDisabled(True)
+        self.undo_action = self.undo_group.createUndoAction(self, "Undo")
+        self.undo_action.setIcon(self.get_icon(QStyle.SP_ArrowBack))
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.redo_action = self.undo_group.createRedoAction(self, "Redo")
+        self.redo_action.setIcon(self.get_icon(QStyle.SP_ArrowForward))
+        self.redo_action.setShortcut(QKeySequence.Redo)
+        self.text_search_action = create_action(
+            None, "Search text ...",
+            self.handle_text_search_action,
+            QKeySequence("Ctrl+Shift+F"))
         self.help_action = create_action(
             None, "Show help",
             self.handle_show_help_action
@@ -370,6 +406,11 @@ class MainWindow(QMainWindow):
         file_menu.insertAction(None, self.import_action)
         file_menu.insertAction(None, self.save_file_action)
 
+        edit_menu = menu_bar.addMenu("Edit")
+        edit_menu.insertAction(None, self.undo_action)
+        edit_menu.insertAction(None, self.redo_action)
+        edit_menu.insertAction(None, self.text_search_action)
+
         quick_access_menu = menu_bar.addMenu("Quick Access")
         for action in self.quick_access_actions:
             quick_access_menu.insertAction(None, action)
@@ -392,6 +433,8 @@ class MainWindow(QMainWindow):
         toolbar.setToolButtonStyle(Qt.ToolButtonTextBesideIcon)
         toolbar.insertAction(None, self.open_mod_directory_action)
         toolbar.insertAction(None, self.save_file_action)
+        toolbar.insertAction(None, self.undo_action)
+        toolbar.insertAction(None, self.redo_action)
 
     def init_file_tree(self, directory, title, action, filtered=False):
         widget = DirectoryDockWidget(directory, filtered=filtered, parent=self)
@@ -413,6 +456,65 @@ class MainWindow(QMainWindow):
         self.addDockWidget(Qt.RightDockWidgetArea, self.help_widget_dock)
         self.help_widget_dock.hide()
 
+    def init_load_progress(self):
+        self.load_progress_bar = QProgressBar()
+        self.load_progress_bar.setMaximumWidth(200)
+        self.load_progress_bar.setFormat("Loading %v/%m")
+        self.load_cancel_button = QToolButton()
+        self.load_cancel_button.setIcon(
+            self.get_icon(QStyle.SP_DialogCancelButton))
+        self.load_cancel_button.setToolTip("Cancel loading")
+        self.load_cancel_button.clicked.connect(self.workspace.cancel_loading)
+        self.statusBar().addPermanentWidget(self.load_progress_bar)
+        self.statusBar().addPermanentWidget(self.load_cancel_button)
+        self.load_progress_bar.hide()
+        self.load_cancel_button.hide()
+
+    def handle_workspace_load_progress(self, done, total):
+        loading = self.workspace.is_loading
+        self.load_progress_bar.setVisible(loading)
+        self.load_cancel_button.setVisible(loading)
+        self.load_progress_bar.setMaximum(total)
+        self.load_progress_bar.setValue(done)
+
+    def init_text_search(self):
+        self.text_search_widget = TextSearchWidget(
+            self.workspace.directories, self)
+        self.text_search_widget.resultActivated.connect(
+            self.handle_text_search_result_activated)
+        self.text_search_dock = QDockWidget("Search text", self)
+        self.text_search_dock.setAllowedAreas(
+            Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+        self.text_search_dock.setFeatures(
+            QDockWidget.DockWidgetMovable | QDockWidget.DockWidgetClosable)
+        self.text_search_dock.setWidget(self.text_search_widget)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.text_search_dock)
+        self.text_search_dock.hide()
+
+    def handle_text_search_action(self):
+        self.text_search_dock.show()
+        self.text_search_widget.query_edit.setFocus()
+
+    def handle_text_search_result_activated(self, path, string_index):
+        self.pending_string_selection = (path, string_index)
+        for directory in self.workspace.directories:
+            if directory.is_valid \
+                    and path.startswith(os.path.join(directory.path, "")):
+                self.workspace.open_file(directory, path)
+                break
+
+    def select_pending_string(self, path):
+        if self.pending_string_selection is None \
+                or self.pending_string_selection[0] != path:
+            return
+        _, string_index = self.pending_string_selection
+        self.pending_string_selection = None
+        editor_view = self.editor_tabs.findChild(QWidget, path)
+        if editor_view is None:
+            return
+        for editor in editor_view.findChildren(GmdTableEditor):
+            editor.select_string(string_index)
+
     def handle_show_help_action(self):
         if self.help_widget_dock.isVisible():
             self.help_widget_dock.hide()
@@ -431,10 +533,13 @@ class MainWindow(QMainWindow):
         self.editor_tabs.setTabsClosable(True)
         self.editor_tabs.tabCloseRequested.connect(
             self.handle_editor_tab_close_requested)
+        self.editor_tabs.currentChanged.connect(
+            self.handle_editor_tab_current_changed)
         return self.editor_tabs
 
     def handle_workspace_file_opened(self, path, rel_path):
         ws_file = self.workspace.files[path]
+        self.undo_group.addStack(ws_file.undo_stack)
         editor_view = EditorView.factory(self.editor_tabs, ws_file)
         editor_view.setObjectName(path)
         self.editor_tabs.addTab(editor_view,
@@ -444,13 +549,16 @@ class MainWindow(QMainWindow):
         self.save_file_action.setDisabled(False)
         self.export_action.setDisabled(False)
         self.import_action.setDisabled(False)
+        self.select_pending_string(path)
 
     def handle_workspace_file_activated(self, path, rel_path):
         widget = self.editor_tabs.findChild(QWidget, path)
         self.editor_tabs.setCurrentWidget(widget)
+        self.select_pending_string(path)
 
     def handle_workspace_file_closed(self, path, rel_path):
         widget = self.editor_tabs.findChild(QWidget, path)
+        self.undo_group.removeStack(widget.workspace_file.undo_stack)
         widget.deleteLater()
         has_no_files_open = not self.workspace.files
         self.save_file_action.setDisabled(has_no_files_open)
@@ -462,6 +570,29 @@ class MainWindow(QMainWindow):
                             f"Error while loading\n{path}:\n\n{error}",
                             QMessageBox.Ok, QMessageBox.Ok)
 
+    def handle_workspace_file_conflict(self, path, rel_path):
+        if path in self.file_conflicts:
+            return
+        self.file_conflicts.add(path)
+        try:
+            result = QMessageBox.question(
+                self, "File changed on disk",
+                f"File '{rel_path}' was changed on disk, but has unsaved "
+                f"changes.\n\nReload it and discard your changes?",
+                QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Cancel)
+        finally:
+            self.file_conflicts.discard(path)
+        if result == QMessageBox.Ok:
+            self.workspace.reload_file(path)
+
+    def handle_editor_tab_current_changed(self, tab_index):
+        editor_view = self.editor_tabs.widget(tab_index)
+        if editor_view is None:
+            self.undo_group.setActiveStack(None)
+        else:
+            self.undo_group.setActiveStack(
+                editor_view.workspace_file.undo_stack)
+
     def handle_editor_tab_close_requested(self, tab_index):
         editor_view = self.editor_tabs.widget(tab_index)
         self.workspace.close_file(editor_view.workspace_file)
@@ -480,22 +611,28 @@ class MainWindow(QMainWindow):
 
     def handle_save_file_action(self):
         main_ws_file = self.get_current_workspace_file()
+        reopen = False
         for ws_file in main_ws_file.get_files_modified():
             if ws_file.directory is self.chunk_directory:
                 if self.mod_directory.is_valid:
-                    self.transfer_file_to_mod_workspace(
-                        ws_file, ws_file is main_ws_file)
+                    transferred = self.transfer_file_to_mod_workspace(ws_file)
+                    reopen |= transferred and ws_file is main_ws_file
                 else:
                     self.save_base_content_file(ws_file)
             else:
                 with show_error_dialog(self, "Error writing file"):
                     self.save_workspace_file(ws_file)
+        # only with all relations transferred they are found in the mod
+        # directory, see Workspace.open_file
+        if reopen:
+            self.workspace.open_file(self.mod_directory,
+                                     main_ws_file.abs_path)
 
     def handle_export_file_action(self):
         ws_file = self.get_current_workspace_file()
         plugin = FilePluginRegistry.get_plugin(ws_file.abs_path)
         fields = plugin.data_factory.EntryFactory.fields()
-        data = [it.as_dict() for it in ws_file.data.entries]
+        data = ws_file.data.as_dicts()
         dialog = ExportDialog.init(self, data, fields,
                                    plugin.import_export.get("safe_attrs"))
         dialog.open()
@@ -513,9 +650,7 @@ class MainWindow(QMainWindow):
 
     def handle_import_accepted(self, import_data):
         ws_file = self.get_current_workspace_file()
-        num_items = min(len(import_data), len(ws_file.data))
-        for idx in range(num_items):
-            ws_file.data[idx].update(import_data[idx])
+        num_items = ws_file.data.update_entries(import_data)
         self.statusBar().showMessage(
             f"Import contains {len(import_data)} items. "
             f"Model contains {len(ws_file.data)} items. "
@@ -527,6 +662,7 @@ class MainWindow(QMainWindow):
         for act in self.lang_actions.values():
             act.setChecked(False)
         self.lang_actions[lang].setChecked(True)
+        self.workspace.reload_translations()
 
     def get_current_workspace_file(self):
         editor = self.editor_tabs.currentWidget()
@@ -541,10 +677,12 @@ class MainWindow(QMainWindow):
             with show_error_dialog(self, "Error writing file"):
                 self.save_workspace_file(ws_file)
 
-    def transfer_file_to_mod_workspace(self, ws_file, reopen=False):
+    def transfer_file_to_mod_workspace(self, ws_file):
+        """Move ws_file to the mod directory and save it there, return
+        whether it was moved."""
         mod_abs_path, exists = self.mod_directory.get_child_path(ws_file.rel_path)
         if not exists:
-            return self.transfer_file(ws_file, self.mod_directory, reopen)
+            return self.transfer_file(ws_file, self.mod_directory)
 
         result = QMessageBox.question(
             self,
@@ -552,16 +690,17 @@ class MainWindow(QMainWindow):
             f"File '{ws_file.rel_path}' already found in mod directory, overwrite?",
             QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Ok)
         if result == QMessageBox.Ok:
-            self.transfer_file(ws_file, self.mod_directory, reopen)
+            return self.transfer_file(ws_file, self.mod_directory)
+        return False
 
-    def transfer_file(self, ws_file, target_directory, reopen=False):
+    def transfer_file(self, ws_file, target_directory):
         if target_directory is ws_file.directory:
-            return
-        self.workspace.close_file(ws_file)
+            return False
+        if ws_file.abs_path in self.workspace.files:
+            self.workspace.close_file(ws_file)
         ws_file.set_directory(target_directory)
         self.save_workspace_file(ws_file)
-        if reopen:
-            self.workspace.open_file(target_directory, ws_file.abs_path)
+        return True
 
     def save_workspace_file(self, ws_file):
         ws_file.save()
@@ -582,6 +721,8 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == '__main__':
+    # the text index is built in worker processes
+    multiprocessing.freeze_support()
     logging.basicConfig(level=logging.DEBUG,
                         format="%(levelname)s %(message)s")
     app = QApplication(sys.argv)
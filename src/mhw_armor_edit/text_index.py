@@ -0,0 +1,258 @@
+# coding: utf-8
+import logging
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from mhw_armor_edit.ftypes.gmd import Gmd
+
+log = logging.getLogger(__name__)
+
+TEXT_DIR = os.path.join("common", "text")
+TOKEN_RE = re.compile(r"\w+")
+SNIPPET_CONTEXT = 30
+
+SearchResult = namedtuple("SearchResult", (
+    "path",
+    "string_index",
+    "key",
+    "snippet",
+))
+
+# the text of one GMD file, with postings mapping each token to the
+# indexes of the strings containing it
+FileText = namedtuple("FileText", (
+    "path",
+    "mtime_ns",
+    "size",
+    "keys",
+    "strings",
+    "postings",
+))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def read_file_text(path):
+    """Read the strings and keys of the GMD at path and index their
+    tokens. Runs in worker processes, returns None for unreadable files."""
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as fp:
+            gmd = Gmd.load(fp)
+        strings = list(gmd.string_table)
+    except Exception as e:
+        log.warning("can't index %s: %s", path, e)
+        return None
+    keys = [""] * len(strings)
+    info_table = gmd.info_table
+    for string_index, key_offset in zip(info_table.string_index,
+                                        info_table.key_offset):
+        if string_index < len(keys):
+            keys[string_index] = gmd.key_table[key_offset]
+    postings = {}
+    for index, value in enumerate(strings):
+        for token in set(tokenize(value)):
+            postings.setdefault(token, array("I")).append(index)
+    return FileText(path, stat.st_mtime_ns, stat.st_size, keys, strings,
+                    postings)
+
+
+def find_text_files(root):
+    """Yield the path and stat of every GMD below the text directory of
+    root."""
+    stack = [os.path.join(root, TEXT_DIR)]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif entry.name.endswith(".gmd"):
+                yield os.path.normpath(entry.path), entry.stat()
+
+
+def make_snippet(value, term):
+    start = value.lower().find(term)
+    if start == -1:
+        start = 0
+    begin = max(start - SNIPPET_CONTEXT, 0)
+    end = min(start + len(term) + SNIPPET_CONTEXT, len(value))
+    snippet = value[begin:end].replace("\r", " ").replace("\n", " ")
+    if begin:
+        snippet = "…" + snippet
+    if end < len(value):
+        snippet += "…"
+    return snippet
+
+
+class TextIndex:
+    """Inverted index of the strings of all GMD text files below a set of
+    root directories.
+
+    Strings are split into lowercase word tokens, every token is indexed
+    by its trigrams, so query terms match anywhere within a token, which
+    matters for languages not separating words by spaces. Queries return
+    the strings containing all query terms.
+
+    update only reads files added or changed since the last update, as
+    told by their mtime and size, in a pool of worker processes. The
+    index is kept in path with save and load.
+    """
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        self.postings = {}
+        self.trigrams = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, file_text):
+        path = file_text.path
+        self.files[path] = file_text
+        for token, indexes in file_text.postings.items():
+            paths = self.postings.get(token)
+            if paths is None:
+                paths = self.postings[token] = {}
+                for trigram in trigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            paths[path] = indexes
+
+    def remove_file(self, path):
+        file_text = self.files.pop(path)
+        for token in file_text.postings:
+            paths = self.postings[token]
+            del paths[path]
+            if paths:
+                continue
+            del self.postings[token]
+            for trigram in trigrams(token):
+                tokens = self.trigrams[trigram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.trigrams[trigram]
+
+    def stale_files(self, roots):
+        """Get the paths of files to read and of files to remove, for the
+        files currently below roots."""
+        found = {}
+        for root in roots:
+            for path, stat in find_text_files(root):
+                found[path] = stat
+        changed = [
+            path for path, stat in found.items()
+            if path not in self.files
+            or self.files[path].mtime_ns != stat.st_mtime_ns
+            or self.files[path].size != stat.st_size
+        ]
+        removed = [path for path in self.files if path not in found]
+        return changed, removed
+
+    def update(self, roots, max_workers=None, progress_cb=None):
+        """Bring the index up to date with the files below roots, return
+        the number of files read and removed."""
+        changed, removed = self.stale_files(roots)
+        with self.lock:
+            for path in removed:
+                self.remove_file(path)
+        if changed:
+            with ProcessPoolExecutor(max_workers) as executor:
+                chunksize = max(len(changed) // 64, 1)
+                results = executor.map(read_file_text, changed,
+                                       chunksize=chunksize)
+                for done, (path, file_text) in enumerate(
+                        zip(changed, results), 1):
+                    with self.lock:
+                        if path in self.files:
+                            self.remove_file(path)
+                        if file_text is not None:
+                            self.add_file(file_text)
+                    if progress_cb:
+                        progress_cb(done, len(changed))
+        return len(changed), len(removed)
+
+    def match_tokens(self, term):
+        """Get the indexed tokens containing term."""
+        if len(term) < 3:
+            return [it for it in self.postings if term in it]
+        sets = sorted((self.trigrams.get(it, ()) for it in trigrams(term)),
+                      key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return [it for it in candidates if term in it]
+
+    def match_term(self, term):
+        """Map path to the set of string indexes containing term."""
+        hits = {}
+        for token in self.match_tokens(term):
+            for path, indexes in self.postings[token].items():
+                hits.setdefault(path, set()).update(indexes)
+        return hits
+
+    def search(self, query, limit=500):
+        """Get the SearchResult of the strings containing all terms of
+        query, at most limit, ordered by path and string index."""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return []
+        with self.lock:
+            hits = self.match_term(terms[0])
+            for term in terms[1:]:
+                if not hits:
+                    break
+                term_hits = self.match_term(term)
+                hits = {
+                    path: indexes & term_hits[path]
+                    for path, indexes in hits.items()
+                    if path in term_hits
+                }
+            results = []
+            for path in sorted(hits):
+                file_text = self.files[path]
+                for index in sorted(hits[path]):
+                    if len(results) >= limit:
+                        return results
+                    value = file_text.strings[index]
+                    results.append(SearchResult(
+                        path, index, file_text.keys[index],
+                        make_snippet(value, terms[0])))
+            return results
+
+    def __len__(self):
+        return len(self.files)
+
+    def save(self):
+        with self.lock:
+            files = list(self.files.values())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump((self.VERSION, files), fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Load the index saved in path, if there's a usable one."""
+        try:
+            with open(self.path, "rb") as fp:
+                version, files = pickle.load(fp)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning("discarding text index %s: %s", self.path, e)
+            return
+        if version != self.VERSION:
+            return
+        with self.lock:
+            for file_text in files:
+                self.add_file(file_text)
@@ -0,0 +1,206 @@
+# coding: utf-8
+import logging
+import os
+
+from PyQt5.QtCore import (QAbstractTableModel, QModelIndex, QObject,
+                          QRunnable, QStandardPaths, QThreadPool, QTimer, Qt,
+                          pyqtSignal)
+from PyQt5.QtWidgets import (QAbstractItemView, QHeaderView, QLabel,
+                             QLineEdit, QProgressBar, QTableView,
+                             QVBoxLayout, QWidget)
+
+from mhw_armor_edit.text_index import TextIndex
+
+log = logging.getLogger(__name__)
+
+
+class TextIndexUpdateSignals(QObject):
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+
+class TextIndexUpdate(QRunnable):
+    """Update a TextIndex off the GUI thread, then save it. With load,
+    the saved index is loaded first."""
+
+    def __init__(self, index, roots, load=False):
+        super().__init__()
+        self.index = index
+        self.roots = roots
+        self.load = load
+        self.signals = TextIndexUpdateSignals()
+
+    def run(self):
+        try:
+            if self.load:
+                self.index.load()
+            changed, removed = self.index.update(
+                self.roots, progress_cb=self.signals.progress.emit)
+            if changed or removed:
+                self.index.save()
+        except Exception as e:
+            log.exception("error updating text index")
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(changed, removed)
+
+
+class TextSearchResultsModel(QAbstractTableModel):
+    columns = ("file", "index", "key", "text")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = []
+        self.rel_paths = []
+
+    def columnCount(self, parent=None, *args, **kwargs):
+        return len(self.columns)
+
+    def rowCount(self, parent=None, *args, **kwargs):
+        return len(self.results)
+
+    def headerData(self, section, orient, role=None):
+        if role == Qt.DisplayRole and orient == Qt.Horizontal:
+            return self.columns[section]
+
+    def data(self, qindex: QModelIndex, role=None):
+        if not qindex.isValid():
+            return None
+        result = self.results[qindex.row()]
+        column = qindex.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return self.rel_paths[qindex.row()]
+            return (None, result.string_index, result.key,
+                    result.snippet)[column]
+        if role == Qt.ToolTipRole and column == 0:
+            return result.path
+        return None
+
+    def update(self, results, rel_paths):
+        self.beginResetModel()
+        self.results = results
+        self.rel_paths = rel_paths
+        self.endResetModel()
+
+
+class TextSearchWidget(QWidget):
+    """Search the text of every GMD in the directories.
+
+    Emits resultActivated with the absolute path and string index of an
+    activated result. The index is only loaded and updated once the
+    widget is first shown.
+    """
+    resultActivated = pyqtSignal(str, int)
+    # delay searching while still typing
+    SEARCH_DELAY = 200
+
+    def __init__(self, directories, parent=None):
+        super().__init__(parent)
+        self.directories = directories
+        self.index = TextIndex(self.get_index_path())
+        self.index_loaded = False
+        self.updating = False
+        self.update_pending = False
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.setLayout(layout)
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Search text ...")
+        self.query_edit.setClearButtonEnabled(True)
+        layout.addWidget(self.query_edit)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.results_model = TextSearchResultsModel(self)
+        self.results_view = QTableView()
+        self.results_view.setModel(self.results_model)
+        self.results_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.results_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.results_view.verticalHeader().hide()
+        self.results_view.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeToContents)
+        self.results_view.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.results_view)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.search)
+        self.query_edit.textChanged.connect(self.search_timer.start)
+        self.query_edit.returnPressed.connect(self.search)
+        self.results_view.activated.connect(self.handle_result_activated)
+        for directory in directories:
+            directory.changed.connect(self.update_index)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.index_loaded and not self.updating:
+            self.update_index()
+
+    @staticmethod
+    def get_index_path():
+        path = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, "text_index.pickle")
+
+    def get_roots(self):
+        return [it.path for it in self.directories if it.is_valid]
+
+    def update_index(self):
+        if not self.index_loaded and not self.isVisible():
+            return
+        if self.updating:
+            self.update_pending = True
+            return
+        self.updating = True
+        self.update_pending = False
+        task = TextIndexUpdate(self.index, self.get_roots(),
+                               load=not self.index_loaded)
+        self.index_loaded = True
+        task.signals.progress.connect(self.handle_update_progress)
+        task.signals.finished.connect(self.handle_update_finished)
+        task.signals.failed.connect(self.handle_update_failed)
+        QThreadPool.globalInstance().start(task)
+
+    def handle_update_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.show()
+
+    def handle_update_finished(self, changed, removed):
+        self.finish_update(f"{len(self.index)} files indexed")
+
+    def handle_update_failed(self, error):
+        self.finish_update(f"Error indexing files: {error}")
+
+    def finish_update(self, status):
+        self.updating = False
+        self.progress_bar.hide()
+        self.status_label.setText(status)
+        if self.update_pending:
+            self.update_index()
+        elif self.query_edit.text():
+            self.search()
+
+    def search(self):
+        self.search_timer.stop()
+        results = self.index.search(self.query_edit.text())
+        self.results_model.update(
+            results, [self.get_rel_path(it.path) for it in results])
+        if self.query_edit.text():
+            self.status_label.setText(f"{len(results)} results")
+
+    def get_rel_path(self, path):
+        for directory in self.directories:
+            if directory.is_valid \
+                    and path.startswith(os.path.join(directory.path, "")):
+                return f"{directory.name}: " \
+                       f"{directory.get_child_rel_path(path)}"
+        return path
+
+    def handle_result_activated(self, qindex):
+        result = self.results_model.results[qindex.row()]
+        self.resultActivated.emit(result.path, result.string_index)
@@ -45,6 +45,8 @@ class TreeModel(QAbstractItemModel):
 
 
 class TreeNode:
+    __slots__ = ("parent", "row", "subnodes")
+
     def __init__(self, parent, row):
         self.parent = parent
         self.row = row
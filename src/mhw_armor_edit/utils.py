@@ -11,29 +11,25 @@ log = logging.getLogger(__name__)
 
 
 def get_t9n(model, key, index):
+    """Get the display string at index of the translation relation key,
+    see Gmd.display_strings."""
     t9n = model.get_relation_data(key)
     if t9n is None:
         return f"{key}({index})"
-    # val = t9n.get_string(index, f"{key}({index})")
-    # return f"{val}({index})"
     try:
-        val = t9n.items[index].value
-        if not val:
-            return f"<blank:{index}>"
-        return val \
-            .replace("<ICON ALPHA>", " α") \
-            .replace("<ICON BETA>", " β") \
-            .replace("<ICON GAMMA>", " γ")
+        return t9n.display_strings[index]
     except IndexError:
         log.warning("missing item at index %s", index)
         return f"{key}({index}) <missing t9n>"
 
 
 def get_t9n_item(model, key, index):
+    # two strings per item, the name first
     return get_t9n(model, key, index * 2)
 
 
 def get_t9n_skill(model, key, index):
+    # three strings per skill, the name first
     return get_t9n(model, key, index * 3)
 
 
@@ -0,0 +1,79 @@
+# coding: utf-8
+"""Attribute reads and writes through the generated field accessors.
+
+Compares the accessors StructMeta generates per field against the generic
+StructField descriptor, bound to twin classes with the same layout.
+
+Run: PYTHONPATH=src python test/benchmark/bench_field_access.py
+"""
+import timeit
+
+from synthetic import make_struct_file
+from mhw_armor_edit.ftypes import StructField
+from mhw_armor_edit.ftypes.am_dat import AmDat
+from mhw_armor_edit.ftypes.sh_tbl import ShlTbl
+from mhw_armor_edit.ftypes.wp_dat import WpDat
+
+NUM_ENTRIES = 1000
+REPEAT = 5
+
+
+def generic_twin(entry_cls):
+    """Same layout as entry_cls, using plain StructField descriptors."""
+    namespace = {"__slots__": ("parent", "index", "data", "offset")}
+    for name in entry_cls.__fields__:
+        field = getattr(entry_cls, name)
+        namespace[name] = StructField(
+            field.index, field.offset, field.fmt, field.multi)
+    return type(f"Generic{entry_cls.__name__}", (), namespace)
+
+
+def generic_entries(entries, twin):
+    result = []
+    for entry in entries:
+        generic = twin()
+        generic.parent = entry.parent
+        generic.index = entry.index
+        generic.data = entry.data
+        generic.offset = entry.offset
+        result.append(generic)
+    return result
+
+
+def read_all(entries, names):
+    for entry in entries:
+        for name in names:
+            getattr(entry, name)
+
+
+def write_all(entries, names):
+    for entry in entries:
+        for name in names:
+            setattr(entry, name, getattr(entry, name))
+
+
+def best_of(func, *args):
+    return min(timeit.repeat(lambda: func(*args), number=1, repeat=REPEAT))
+
+
+def main():
+    for cls in (AmDat, WpDat, ShlTbl):
+        data_file = make_struct_file(cls, NUM_ENTRIES)
+        entry_cls = cls.EntryFactory
+        names = [it for it in entry_cls.__fields__
+                 if not getattr(entry_cls, it).multi]
+        entries = list(data_file.entries)
+        generic = generic_entries(entries, generic_twin(entry_cls))
+        accesses = len(entries) * len(names)
+        for label, func in (("read", read_all), ("write", write_all)):
+            generated = best_of(func, entries, names)
+            baseline = best_of(func, generic, names)
+            print(f"{entry_cls.__name__:<12} {label:<5} {accesses:>7} "
+                  f"accesses  generic {baseline * 1e9 / accesses:6.1f} ns  "
+                  f"generated {generated * 1e9 / accesses:6.1f} ns  "
+                  f"speedup {baseline / generated:4.2f}x")
+        assert not data_file.modified
+
+
+if __name__ == '__main__':
+    main()
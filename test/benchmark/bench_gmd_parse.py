@@ -0,0 +1,116 @@
+# coding: utf-8
+"""Key, string and info block parsing of a large synthetic GMD.
+
+Compares the offset indexed tables against the previous parsers, which
+walked the key block byte by byte and decoded every string on its own,
+and the array-backed info table against reading a Struct per info item
+and a dict-backed object per keyless string.
+Tables only index the string offsets when loading, "decode all" is the
+bulk decode of every string, eg. when iterating the string table.
+
+Run: PYTHONPATH=src python test/benchmark/bench_gmd_parse.py
+"""
+import timeit
+
+from synthetic import make_gmd_data
+from mhw_armor_edit.ftypes.gmd import (Gmd, GmdInfoItem, GmdInfoTable,
+                                       GmdKeyTable, GmdStringTable)
+
+NUM_KEYS = 50000
+REPEAT = 5
+
+
+def legacy_read_keys(data, offset, block_size):
+    i = 0
+    key_offset = 0
+    items = {}
+    val = bytearray()
+    while i < block_size:
+        ch = data[offset + i]
+        i += 1
+        if ch == 0:
+            items[key_offset] = val.decode("UTF-8")
+            val = bytearray()
+            key_offset = i
+        else:
+            val.append(ch)
+    return items
+
+
+def legacy_read_strings(data, offset):
+    return [it.decode("UTF-8") for it in data[offset:-1].split(b"\x00")]
+
+
+class LegacyKeyless:
+    def __init__(self, parent, index):
+        self.__dict__.update(parent)
+        self.index = index
+        self.string_index = index
+        self.key_offset = -1
+
+
+def legacy_read_info(data, offset, key_count, string_count):
+    items = []
+    prev_string_index = 0
+    for key_index in range(key_count):
+        item = GmdInfoItem(None, key_index, data,
+                           offset + key_index * GmdInfoItem.STRUCT_SIZE)
+        for missing in range(prev_string_index + 1, item.string_index):
+            items.append(LegacyKeyless(item.as_dict(), missing))
+        prev_string_index = item.string_index
+        items.append(item)
+    for missing in range(prev_string_index + 1, string_count):
+        items.append(LegacyKeyless({"list_index": 0}, missing))
+    return items
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main():
+    # 10% keyless strings, so the key count is NUM_KEYS
+    data = make_gmd_data(NUM_KEYS * 10 // 9 + 1)
+    gmd = Gmd(data)
+    key_table = gmd.key_table
+    string_table = gmd.string_table
+    info_table = gmd.info_table
+    legacy_keys = legacy_read_keys(data, key_table.offset,
+                                   key_table.block_size)
+    assert [key_table[it] for it in legacy_keys] == list(legacy_keys.values())
+    assert legacy_read_strings(data, string_table.offset) == \
+        list(string_table)
+    print(f"{len(key_table)} keys ({key_table.block_size} bytes), "
+          f"{len(string_table)} strings ({string_table.block_size} bytes)")
+    for label, legacy, bulk in (
+            ("keys",
+             lambda: legacy_read_keys(data, key_table.offset,
+                                      key_table.block_size),
+             lambda: GmdKeyTable(data, key_table.offset,
+                                 key_table.block_size, key_table.count)),
+            ("strings",
+             lambda: legacy_read_strings(data, string_table.offset),
+             lambda: GmdStringTable(data, string_table.offset,
+                                    string_table.block_size,
+                                    string_table.count)),
+            ("decode all",
+             lambda: legacy_read_strings(data, string_table.offset),
+             lambda: list(string_table)),
+            ("info", lambda: legacy_read_info(data, info_table.offset,
+                                              info_table.key_count,
+                                              info_table.string_count),
+             lambda: GmdInfoTable(data, info_table.offset,
+                                  info_table.key_count,
+                                  info_table.string_count)),
+            ("full load", None, lambda: Gmd(data))):
+        current = best_of(bulk)
+        line = f"{label:<10} current {current * 1000:8.2f} ms"
+        if legacy is not None:
+            previous = best_of(legacy)
+            line += f"  previous {previous * 1000:8.2f} ms  " \
+                    f"speedup {previous / current:5.1f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
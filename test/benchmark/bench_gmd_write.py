@@ -0,0 +1,64 @@
+# coding: utf-8
+"""Serializing a large synthetic GMD, as done on every save.
+
+Compares Gmd.serialize against a straightforward writer that encodes
+every key and string and joins the blocks, for an unmodified file, one
+with 1% of the strings edited and one with strings added.
+
+Run: PYTHONPATH=src python test/benchmark/bench_gmd_write.py
+"""
+import struct
+import timeit
+
+from synthetic import make_gmd_data
+from mhw_armor_edit.ftypes.gmd import Gmd, GmdHeader
+
+NUM_STRINGS = 50000
+REPEAT = 5
+
+
+def naive_serialize(gmd):
+    info_table = gmd.info_table
+    keys = b"".join(it.encode("UTF-8") + b"\x00" for it in gmd.key_table)
+    strings = b"".join(
+        it.encode("UTF-8") + b"\x00" for it in gmd.string_table)
+    header = bytearray(gmd.data[:info_table.after])
+    for field, value in (
+            (GmdHeader.key_count, info_table.total_key_count),
+            (GmdHeader.string_count, len(gmd.string_table)),
+            (GmdHeader.key_block_size, len(keys)),
+            (GmdHeader.string_block_size, len(strings))):
+        struct.pack_into("<I", header, field.offset, value)
+    return header + info_table.added \
+        + gmd.data[gmd.unknown_block.offset:gmd.unknown_block.after] \
+        + keys + strings
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main():
+    data = make_gmd_data(NUM_STRINGS)
+    unmodified = Gmd(data)
+    edited = Gmd(bytearray(data))
+    for index in range(0, NUM_STRINGS, 100):
+        edited.set_string(index, f"Édité {index}")
+    added = Gmd(bytearray(data))
+    for index in range(NUM_STRINGS // 100):
+        added.add_item(f"ADDED_{index:05d}", f"Added string {index}")
+    print(f"{NUM_STRINGS} strings ({len(data)} bytes)")
+    for label, gmd in (("unmodified", unmodified),
+                       ("edited", edited),
+                       ("added", added)):
+        assert gmd.serialize() == naive_serialize(gmd)
+        current = best_of(gmd.serialize)
+        previous = best_of(lambda: naive_serialize(gmd))
+        print(f"{label:<10} current {current * 1000:8.2f} ms  "
+              f"naive {previous * 1000:8.2f} ms  "
+              f"speedup {previous / current:5.1f}x")
+    assert unmodified.serialize() == data
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""Per-entry memory of slotted Struct entries and tree nodes.
+
+Compares the slotted instances against dict-backed objects holding the
+same attributes, which is what every instance carried before.
+
+Run: PYTHONPATH=src python test/benchmark/bench_memory.py
+"""
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+from synthetic import make_struct_file
+from mhw_armor_edit.ftypes.am_dat import AmDat
+from mhw_armor_edit.ftypes.sh_tbl import ShlTbl
+
+NUM_ENTRIES = 5000
+
+
+def slot_names(obj):
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if name != "__weakref__":
+                yield name
+
+
+def dict_backed_size(obj):
+    ns = SimpleNamespace(**{name: getattr(obj, name)
+                            for name in slot_names(obj)})
+    return sys.getsizeof(ns) + sys.getsizeof(ns.__dict__)
+
+
+def measure(build):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objects, after - before
+
+
+def report(label, objects, traced=None):
+    slotted = sum(sys.getsizeof(it) for it in objects) / len(objects)
+    baseline = sum(dict_backed_size(it) for it in objects) / len(objects)
+    line = f"{label:<20} {len(objects):>6} objects  " \
+           f"slotted {slotted:6.1f} B  " \
+           f"dict-backed {baseline:6.1f} B  " \
+           f"saving {baseline - slotted:6.1f} B/obj"
+    if traced is not None:
+        line += f"  (traced incl. list/cache: {traced / len(objects):.1f} B)"
+    print(line)
+
+
+def iter_nodes(nodes):
+    for node in nodes:
+        yield node
+        yield from iter_nodes(node.subnodes)
+
+
+def main():
+    for cls in (AmDat, ShlTbl):
+        data_file = make_struct_file(cls, NUM_ENTRIES)
+        entries, total = measure(lambda: list(data_file.entries))
+        report(cls.EntryFactory.__name__, entries, total)
+    try:
+        from mhw_armor_edit.editor.shell_table_editor import ShellTreeRootNode
+    except ImportError:
+        print("PyQt5 not available, skipping tree node measurement")
+        return
+    entries = list(make_struct_file(ShlTbl, NUM_ENTRIES // 10).entries)
+    roots, _ = measure(lambda: [ShellTreeRootNode(entry, None, i)
+                                for i, entry in enumerate(entries)])
+    by_type = {}
+    for node in iter_nodes(roots):
+        by_type.setdefault(type(node).__name__, []).append(node)
+    for name, nodes in by_type.items():
+        report(name, nodes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# coding: utf-8
+"""Translation lookups as done by the table models for every visible cell.
+
+Compares get_t9n_item against the previous lookup, which built the
+GmdItem of the info table item and sanitized its value on every call.
+
+Run: PYTHONPATH=src python test/benchmark/bench_t9n.py
+"""
+import timeit
+
+from synthetic import make_gmd_data
+from mhw_armor_edit.ftypes.gmd import Gmd
+from mhw_armor_edit.utils import get_t9n_item
+
+NUM_STRINGS = 5000
+# cells repainted while scrolling through a table, a few times over
+NUM_LOOKUPS = 100000
+REPEAT = 5
+
+
+class Model:
+    def __init__(self, gmd):
+        self.relations = {"t9n_item": gmd}
+
+    def get_relation_data(self, key):
+        return self.relations.get(key)
+
+
+def legacy_get_t9n(model, key, index):
+    t9n = model.get_relation_data(key)
+    if t9n is None:
+        return f"{key}({index})"
+    try:
+        val = t9n.items[index].value
+        if not val:
+            return f"<blank:{index}>"
+        return val \
+            .replace("<ICON ALPHA>", " α") \
+            .replace("<ICON BETA>", " β") \
+            .replace("<ICON GAMMA>", " γ")
+    except IndexError:
+        return f"{key}({index}) <missing t9n>"
+
+
+def lookup_all(func, model, ids):
+    for index in ids:
+        func(model, "t9n_item", index)
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main():
+    model = Model(Gmd(make_gmd_data(NUM_STRINGS)))
+    ids = [i % (NUM_STRINGS // 2) for i in range(NUM_LOOKUPS)]
+    assert all(get_t9n_item(model, "t9n_item", i)
+               == legacy_get_t9n(model, "t9n_item", i * 2)
+               for i in range(NUM_STRINGS // 2))
+    current = best_of(lambda: lookup_all(get_t9n_item, model, ids))
+    previous = best_of(lambda: lookup_all(
+        lambda m, k, i: legacy_get_t9n(m, k, i * 2), model, ids))
+    print(f"{NUM_LOOKUPS} lookups  current {current * 1e9 / NUM_LOOKUPS:7.1f} "
+          f"ns  previous {previous * 1e9 / NUM_LOOKUPS:7.1f} ns  "
+          f"speedup {previous / current:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# coding: utf-8
+"""Synthetic game data files for benchmarks, no extracted chunk required."""
+import os
+import random
+import struct
+import sys
+
+# the GMD builder of the unit tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from unit.test_gmd import make_gmd_data as build_gmd_data  # noqa: E402
+
+
+def make_struct_file_data(cls, num_entries, seed=0):
+    rnd = random.Random(seed)
+    size = cls.EntryFactory.STRUCT_SIZE
+    data = bytearray(cls.ENTRY_OFFSET + num_entries * size)
+    struct.pack_into("<H", data, cls.MAGIC_OFFSET, cls.MAGIC)
+    struct.pack_into("<I", data, cls.NUM_ENTRY_OFFSET, num_entries)
+    data[cls.ENTRY_OFFSET:] = bytes(
+        rnd.getrandbits(8) for _ in range(num_entries * size))
+    return data
+
+
+def make_struct_file(cls, num_entries, seed=0):
+    return cls(make_struct_file_data(cls, num_entries, seed))
+
+
+def make_gmd_data(num_strings, keyless_every=10, seed=0):
+    """Build a GMD with num_strings strings, every keyless_every-th one
+    without a key."""
+    rnd = random.Random(seed)
+    words = ("Rathalos", "Attack", "Boost", "Élément", "Great", "Sword",
+             "<ICON ALPHA>", "Mantle", "Charm", "Ω", "Guard", "Up")
+    items = []
+    for string_index in range(num_strings):
+        key = None
+        if string_index % keyless_every != keyless_every - 1:
+            key = f"IS_SYNTH_{string_index:06d}_NAME"
+        value = " ".join(rnd.choice(words)
+                         for _ in range(rnd.randint(1, 12)))
+        items.append((key, value))
+    return build_gmd_data(items, name="synthetic")
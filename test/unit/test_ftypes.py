@@ -0,0 +1,458 @@
+# coding: utf-8
+import io
+import struct
+
+from mhw_armor_edit import ftypes as ft
+from mhw_armor_edit.ftypes import Struct, StructFile
+from mhw_armor_edit.ftypes.am_dat import AmDat, AmDatEntry
+from mhw_armor_edit.ftypes.journal import Journal
+from mhw_armor_edit.ftypes.mkex import Mkex
+from mhw_armor_edit.ftypes.ranges import RangeSet
+from mhw_armor_edit.ftypes.struct_array import Query
+
+
+class SampleEntry(Struct):
+    STRUCT_SIZE = 13
+    id: ft.uint()
+    rarity: ft.ubyte()
+    pad: ft.pad(2)
+    delta: ft.short()
+    value: ft.int()
+
+
+class Sample(StructFile):
+    EntryFactory = SampleEntry
+    MAGIC = 0x0042
+
+
+def make_data(cls, num_entries, fill=None):
+    size = cls.EntryFactory.STRUCT_SIZE
+    data = bytearray(cls.ENTRY_OFFSET + num_entries * size)
+    struct.pack_into("<H", data, cls.MAGIC_OFFSET, cls.MAGIC)
+    struct.pack_into("<I", data, cls.NUM_ENTRY_OFFSET, num_entries)
+    for i in range(num_entries):
+        offset = cls.ENTRY_OFFSET + i * size
+        if fill is None:
+            data[offset:offset + size] = bytes(
+                (i * 7 + j) & 0xFF for j in range(size))
+        else:
+            fill(data, offset, i)
+    return data
+
+
+def fill_sample(data, offset, i):
+    struct.pack_into("<IB2Bhi", data, offset, i, i % 12, 0xAB, i & 0xFF,
+                     -i, i * -1000)
+
+
+def test_record_layout():
+    assert SampleEntry.__record__.size == SampleEntry.STRUCT_SIZE
+    assert AmDatEntry.__record__.size == AmDatEntry.STRUCT_SIZE
+    assert AmDatEntry.__record_groups__ is None
+    assert SampleEntry.__record_groups__ is not None
+
+
+def test_values_match_fields():
+    sample = Sample(make_data(Sample, 20, fill_sample))
+    entry = sample[5]
+    assert entry.values() == (5, 5, "AB 05", -5, -5000)
+    assert entry.as_dict() == {
+        attr: getattr(entry, attr) for attr in SampleEntry.fields()
+    }
+
+
+def test_iter_values_matches_entries():
+    for cls in (Sample, AmDat, Mkex):
+        data_file = cls(make_data(cls, 50))
+        expected = [
+            tuple(getattr(it, attr) for attr in cls.EntryFactory.fields())
+            for it in data_file.entries
+        ]
+        assert list(data_file.iter_values()) == expected
+        assert data_file.as_dicts()[3] == data_file[3].as_dict()
+
+
+def test_as_array_matches_entries():
+    sample = Sample(make_data(Sample, 20, fill_sample))
+    array = sample.as_array()
+    assert len(array) == 20
+    assert list(array["rarity"]) == [it.rarity for it in sample.entries]
+    assert list(array["value"]) == [it.value for it in sample.entries]
+    assert list(array["pad"][3]) == [0xAB, 3]
+    assert sample.column("delta").max() == 0
+
+
+def test_as_array_is_zero_copy():
+    sample = Sample(make_data(Sample, 20, fill_sample))
+    array = sample.as_array()
+    sample[4].rarity = 99
+    assert array["rarity"][4] == 99
+    array["rarity", array["rarity"] == 99] = 3
+    assert sample[4].rarity == 3
+
+
+def test_as_array_write_sets_modified():
+    sample = Sample(make_data(Sample, 20, fill_sample))
+    array = sample.as_array()
+    array["id"] = array["id"]
+    assert not sample.modified
+    array["id", 2] = 1000
+    assert sample.modified
+    assert sample[2].id == 1000
+
+
+def test_entries_are_lazy():
+    sample = Sample(make_data(Sample, 100, fill_sample))
+    assert len(sample.entries) == 100
+    assert len(sample.entries._cache) == 0
+    entry = sample.entries[-1]
+    assert entry.index == 99
+    assert entry is sample.entries[99]
+    assert len(sample.entries._cache) == 1
+    assert [it.id for it in sample.entries[10:13]] == [10, 11, 12]
+    assert sum(1 for _ in sample.entries) == 100
+    del entry
+    assert len(sample.entries._cache) == 0
+
+
+def test_entries_index_error():
+    sample = Sample(make_data(Sample, 3, fill_sample))
+    try:
+        sample.entries[3]
+    except IndexError:
+        pass
+    else:
+        assert False, "expected IndexError"
+    assert sample.find_first(id=2) is sample.entries[2]
+
+
+def test_entries_are_slotted():
+    sample = Sample(make_data(Sample, 1, fill_sample))
+    assert not hasattr(sample[0], "__dict__")
+
+
+def test_load_mmap_copy_on_write(tmp_path):
+    path = tmp_path / "sample.bin"
+    path.write_bytes(make_data(Sample, 10, fill_sample))
+    with open(path, "rb") as fp:
+        sample = Sample.load(fp, use_mmap=True)
+    assert sample.is_mapped
+    entry = sample[3]
+    entry.rarity = 77
+    assert Sample(bytearray(path.read_bytes()))[3].rarity == 3
+    sample.detach()
+    assert not sample.is_mapped
+    assert entry.data is sample.data
+    assert entry.rarity == 77
+    with open(path, "wb") as fp:
+        sample.save(fp)
+    assert Sample(bytearray(path.read_bytes()))[3].rarity == 77
+
+
+def test_load_mmap_falls_back_to_bytearray():
+    fp = io.BytesIO(bytes(make_data(Sample, 2, fill_sample)))
+    sample = Sample.load(fp, use_mmap=True)
+    assert not sample.is_mapped
+    assert sample[1].id == 1
+
+
+def test_range_set_merges():
+    ranges = RangeSet()
+    ranges.add(10, 12)
+    ranges.add(20, 24)
+    ranges.add(12, 14)
+    assert list(ranges) == [(10, 14), (20, 24)]
+    ranges.add(13, 21)
+    assert list(ranges) == [(10, 24)]
+    ranges.add(30, 31)
+    ranges.add(0, 2)
+    assert list(ranges) == [(0, 2), (10, 24), (30, 31)]
+    assert list(ranges.coalesced(6)) == [(0, 2), (10, 31)]
+    assert ranges.size == 17
+    assert 23 in ranges and 24 not in ranges
+
+
+def test_dirty_ranges():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    sample[2].rarity = 2
+    assert not sample.dirty
+    sample[2].rarity = 200
+    sample[2].id = 5
+    offset = sample[2].offset
+    assert list(sample.dirty) == [(offset, offset + 5)]
+    assert sample.changed_fields() == {2: ["id", "rarity"]}
+    sample.as_array()["value", 7] = 1
+    assert sample.changed_fields() == {2: ["id", "rarity"], 7: ["value"]}
+
+
+def test_save_dirty_patches_file(tmp_path):
+    path = tmp_path / "sample.bin"
+    path.write_bytes(make_data(Sample, 10, fill_sample))
+    with open(path, "rb") as fp:
+        sample = Sample.load(fp, use_mmap=True)
+    sample[1].delta = 100
+    sample[8].value = 123456
+    with open(path, "r+b") as fp:
+        sample.save_dirty(fp)
+    assert not sample.modified and not sample.dirty
+    assert path.read_bytes() == bytes(sample.data)
+
+
+def test_update_writes_record_once():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    calls = []
+    sample.modified_cb = calls.append
+    entry = sample[4]
+    entry.update({"rarity": 4, "delta": -4, "unknown": 1, "id": None})
+    assert not sample.modified and not calls
+    entry.update({"rarity": 9, "pad": "01 02", "value": 7})
+    assert entry.values() == (4, 9, "01 02", -4, 7)
+    assert sample.changed_fields() == {4: ["rarity", "pad", "value"]}
+    assert calls == [True]
+
+
+def test_update_entries_batches_callbacks():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    calls = []
+    sample.modified_cb = calls.append
+    rows = [{"rarity": 1, "delta": 3}] * 12
+    assert sample.update_entries(rows) == 10
+    assert calls == [True]
+    assert all(it.rarity == 1 and it.delta == 3 for it in sample.entries)
+
+
+def test_find_uses_declared_index():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    sample.INDEXES = (("rarity",),)
+    assert [it.id for it in sample.find(rarity=5)] == [5, 17, 29]
+    assert ("rarity",) in sample.indexes
+    assert [it.id for it in sample.find(rarity=5, delta=-17)] == [17]
+    assert sample.find_first(rarity=12) is None
+
+
+def test_index_follows_writes():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    index = sample.build_index("rarity", "id")
+    assert index.lookup((5, 17)) == (17,)
+    sample[17].rarity = 6
+    assert index.lookup((5, 17)) == ()
+    assert list(sample.find_indexes(rarity=6, id=17)) == [17]
+    sample[3].update({"id": 17, "rarity": 6})
+    assert list(sample.find_indexes(id=17, rarity=6)) == [3, 17]
+    sample.as_array()["rarity", 3] = 1
+    assert index.lookup((6, 17)) == (17,)
+    assert index.lookup((1, 17)) == (3,)
+
+
+def test_array_write_marks_written_rows():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    sample.journal = Journal(sample)
+    array = sample.as_array()
+    array["rarity", array["rarity"] == 4] = 7
+    array["rarity", [5, 5]] = 5
+    size = SampleEntry.STRUCT_SIZE
+    offsets = [sample[i].offset + 4 for i in (4, 16, 28)]
+    assert list(sample.dirty) == [(it, it + 1) for it in offsets]
+    assert sample.changed_fields() == {4: ["rarity"], 16: ["rarity"],
+                                       28: ["rarity"]}
+    array[2] = array[3]
+    assert (sample[2].offset, sample[2].offset + size) in list(sample.dirty)
+    while sample.journal.undo():
+        pass
+    assert [it.rarity for it in sample.entries[:6]] == [0, 1, 2, 3, 4, 5]
+
+
+def test_query():
+    sample = Sample(make_data(Sample, 40, fill_sample))
+    result = sample.query(rarity__ge=10, delta__gt=-30)
+    assert list(result.indexes) == [10, 11, 22, 23]
+    assert [it.id for it in result] == [10, 11, 22, 23]
+    assert list(result.column("value")) == [-10000, -11000, -22000, -23000]
+    assert result.mask.sum() == 4
+    assert len(sample.query(id__in=(1, 2, 99), rarity=2)) == 1
+
+
+def test_query_across_files():
+    query = Query(rarity__lt=3, id__has=0b10)
+    files = [Sample(make_data(Sample, n, fill_sample)) for n in (5, 15, 30)]
+    assert [list(query(it).indexes) for it in files] == [
+        [2], [2, 14], [2, 14, 26]]
+    try:
+        Query(rarity__like=1)
+    except ValueError:
+        pass
+    else:
+        assert False, "expected ValueError"
+
+
+def test_set_column():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    calls = []
+    sample.modified_cb = calls.append
+    assert sample.set_column("delta", 0, where=sample.query(rarity=3)) == 3
+    assert [it.delta for it in sample.entries[:4]] == [0, -1, -2, 0]
+    assert sample.changed_fields() == {
+        3: ["delta"], 15: ["delta"], 27: ["delta"]}
+    assert calls == [True]
+    try:
+        sample.set_column("rarity", 256)
+    except ValueError:
+        pass
+    else:
+        assert False, "expected ValueError"
+    sample.set_column("rarity", [300, -1], where=[0, 1], overflow="clamp")
+    assert (sample[0].rarity, sample[1].rarity) == (255, 0)
+
+
+def test_update_column():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    sample.update_column("id", "mul", 1.1, where=Query(rarity=11))
+    assert [sample[11].id, sample[23].id] == [12, 25]
+    sample.update_column("delta", "sub", 32750, overflow="clamp")
+    assert sample[29].delta == -32768
+    assert sample[0].delta == -32750
+
+
+class single(ft.StructField):
+    def __init__(self):
+        super().__init__(0, 0, "<f")
+
+
+class FloatSampleEntry(Struct):
+    STRUCT_SIZE = 6
+    id: ft.ushort()
+    scale: single()
+
+
+class FloatSample(StructFile):
+    EntryFactory = FloatSampleEntry
+    MAGIC = 0x0043
+
+
+def test_float_columns_keep_fraction():
+    sample = FloatSample(make_data(FloatSample, 4, lambda data, offset, i:
+                                   struct.pack_into("<Hf", data, offset,
+                                                    i, i + 0.5)))
+    sample.set_column("scale", 1.25, where=[0])
+    sample.update_column("scale", "add", 1, where=[1])
+    sample.update_column("scale", "mul", 2, where=[2])
+    assert [it.scale for it in sample.entries] == [1.25, 2.5, 5.0, 3.5]
+    sample.set_column("id", 2.6, where=[3])
+    assert sample[3].id == 3
+
+
+def test_array_dtype_for_all_file_types():
+    for cls in StructFile.__subclasses__():
+        if cls.EntryFactory is None:
+            continue
+        data_file = cls(make_data(cls, 3))
+        array = data_file.as_array()
+        assert array.dtype.itemsize == cls.EntryFactory.STRUCT_SIZE
+        for field in cls.EntryFactory.fields():
+            if not getattr(cls.EntryFactory, field).multi:
+                assert array[field][2] == getattr(data_file[2], field)
+
+
+def test_journal_undo_redo():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    original = bytes(sample.data)
+    sample.journal = Journal(sample)
+    sample[2].rarity = 50
+    sample[2].rarity = 60
+    sample[3].value = 1
+    assert len(sample.journal.steps) == 2
+    assert sample.journal.steps[0].deltas == [
+        (sample[2].offset + 4, b"\x02", b"\x3c")]
+    assert sample.journal.undo() is sample.journal.steps[1]
+    assert sample[3].value == -3000
+    sample.journal.undo()
+    assert bytes(sample.data) == original
+    assert sample.journal.undo() is None
+    sample.journal.redo()
+    assert sample[2].rarity == 60
+    sample[4].id = 5
+    assert not sample.journal.can_redo()
+    assert len(sample.journal.steps) == 2
+
+
+def test_journal_batch_is_one_step():
+    sample = Sample(make_data(Sample, 30, fill_sample))
+    original = bytes(sample.data)
+    sample.journal = Journal(sample)
+    sample.update_entries([{"rarity": 1, "delta": 3}] * 30)
+    sample.set_column("value", 0, where=sample.query(rarity=1))
+    assert len(sample.journal.steps) == 2
+    sample.journal.undo()
+    sample.journal.undo()
+    assert bytes(sample.data) == original
+    sample.journal.redo()
+    assert all(it.rarity == 1 and it.delta == 3 for it in sample.entries)
+    assert sample[0].value == 0
+
+
+def test_journal_budget():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    sample.journal = Journal(sample, budget=200)
+    for i in range(10):
+        sample[i].id = 100 + i
+        sample.journal.seal()
+    assert sample.journal.trimmed
+    assert sample.journal.size <= 200
+    assert len(sample.journal.steps) == 2
+    while sample.journal.undo():
+        pass
+    assert [it.id for it in sample.entries][-3:] == [107, 8, 9]
+
+
+def test_journal_clean_index():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    journal = sample.journal = Journal(sample, budget=200)
+    sample[0].id = 100
+    journal.mark_clean()
+    assert journal.is_clean()
+    sample[1].id = 101
+    assert not journal.is_clean()
+    journal.undo()
+    assert journal.is_clean()
+    journal.undo()
+    sample[2].id = 102
+    assert journal.clean_index is None
+    journal.mark_clean()
+    for i in range(10):
+        sample[i].value = i
+        journal.seal()
+    assert journal.clean_index is None
+    while journal.undo():
+        pass
+    assert not journal.is_clean()
+
+
+def test_probe(tmp_path):
+    path = tmp_path / "sample.bin"
+    path.write_bytes(make_data(Sample, 10, fill_sample))
+    result = Sample.probe(str(path))
+    assert result == (0x42, 10, 140, 140, True, None)
+    path.write_bytes(make_data(Sample, 10, fill_sample)[:-1])
+    result = Sample.probe(str(path))
+    assert not result.valid and result.actual_size == 139
+    assert not AmDat.probe(str(path)).valid
+    path.write_bytes(b"\x00" * 4)
+    assert Sample.probe(str(path)).error.startswith("file too small")
+    for cls in StructFile.__subclasses__():
+        if cls.EntryFactory is None:
+            continue
+        path.write_bytes(make_data(cls, 3))
+        assert cls.probe(str(path)).valid
+        assert cls.check_header(path.read_bytes())
+
+
+def test_changed_cb():
+    sample = Sample(make_data(Sample, 10, fill_sample))
+    changes = []
+    sample.changed_cb = lambda start, end: changes.append((start, end))
+    sample[1].rarity = 99
+    sample[1].rarity = 99
+    sample.set_column("delta", 5, where=[2, 3])
+    assert len(changes) == 3
+    assert sample.fields_in_ranges(changes) == {
+        1: ["rarity"], 2: ["delta"], 3: ["delta"]}
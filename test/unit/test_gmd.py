@@ -0,0 +1,287 @@
+# coding: utf-8
+import struct
+
+from mhw_armor_edit.ftypes.gmd import Gmd, key_hash
+
+
+def make_gmd_data(items, name="test", hashed=True):
+    """Build a GMD from (key, value) items, key None for keyless items.
+
+    With hashed, key hashes and hash buckets are filled in, else zero.
+    """
+    infos = []
+    keys = bytearray()
+    buckets = [0] * 256
+    tails = {}
+    for string_index, (key, value) in enumerate(items):
+        if key is None:
+            continue
+        hash_2x = key_hash(key, 2) if hashed else 0
+        hash_3x = key_hash(key, 3) if hashed else 0
+        infos.append([string_index, hash_2x, hash_3x, len(keys), 0])
+        keys += key.encode("UTF-8") + b"\x00"
+        if hashed:
+            # the bucket holds the first item, which chain to the next
+            bucket = hash_2x % 256
+            if bucket in tails:
+                infos[tails[bucket]][4] = len(infos) - 1
+            else:
+                buckets[bucket] = len(infos) - 1
+            tails[bucket] = len(infos) - 1
+    strings = b"".join(value.encode("UTF-8") + b"\x00" for _, value in items)
+    header = struct.pack("<10I", Gmd.MAGIC, 0x00010302, 1, 0, 0,
+                         len(infos), len(items), len(keys), len(strings),
+                         len(name))
+    return bytearray(header + name.encode("UTF-8") + b"\x00"
+                     + b"".join(struct.pack("<III4xqq", *it) for it in infos)
+                     + struct.pack("<256q", *buckets) + keys + strings)
+
+
+ITEMS = [
+    ("IS_SKILL_001_NAME", "Attack Boost"),
+    ("IS_SKILL_001_EXP", "Increases attack power."),
+    (None, "Invalid Message"),
+    ("IS_SKILL_002_NAME", "Élément"),
+]
+
+
+def test_load():
+    gmd = Gmd(make_gmd_data(ITEMS))
+    assert gmd.header.name == "test"
+    assert [(it.key, it.value) for it in gmd.items if it.key_offset != -1] \
+        == [it for it in ITEMS if it[0] is not None]
+    assert gmd.get_string(3) == "Élément"
+
+
+def test_probe(tmp_path):
+    path = tmp_path / "test_eng.gmd"
+    data = make_gmd_data(ITEMS)
+    path.write_bytes(data)
+    result = Gmd.probe(str(path))
+    assert result.valid and result.num_entries == 4
+    assert result.expected_size == result.actual_size == len(data)
+    path.write_bytes(data[:-5])
+    assert not Gmd.probe(str(path)).valid
+    path.write_bytes(b"GMD")
+    assert not Gmd.probe(str(path)).valid
+
+
+def test_key_offsets_non_ascii():
+    items = [("KEY_É_1", "a"), ("KEY_2", ""), (None, "c"), ("KEY_Ω_3", "d")]
+    gmd = Gmd(make_gmd_data(items))
+    assert len(gmd.key_table) == 3
+    assert [gmd.key_table[it.key_offset] for it in gmd.info_table
+            if it.key_offset != -1] == ["KEY_É_1", "KEY_2", "KEY_Ω_3"]
+    assert list(gmd.string_table) == ["a", "", "c", "d"]
+
+
+def test_string_table_is_lazy():
+    gmd = Gmd(make_gmd_data(ITEMS * 20))
+    table = gmd.string_table
+    table.CACHE_SIZE = 4
+    assert len(table) == 80 and not table._cache
+    assert table[79] == "Élément" and table[-1] == ""
+    for i in range(10):
+        assert table[i] == ITEMS[i % 4][1]
+    assert len(table._cache) == 4
+    assert list(table)[:4] == [it[1] for it in ITEMS]
+    assert len(gmd.items) == 80
+    assert gmd.items[2].key == "" and gmd.items[2].value == "Invalid Message"
+    assert [it.value for it in gmd.items[:2]] == [it[1] for it in ITEMS[:2]]
+    try:
+        table[80]
+    except IndexError:
+        pass
+    else:
+        assert False, "expected IndexError"
+
+
+def check_get_by_key(gmd, items):
+    for item in gmd.items:
+        if item.key_offset == -1:
+            continue
+        assert gmd.get_by_key(item.key) == item
+    assert gmd.get_by_key("IS_MISSING", 1) == 1
+    assert {key: gmd.get_by_key(key).value for key, _ in items if key} \
+        == {key: value for key, value in items if key}
+
+
+def test_get_by_key_hashed():
+    items = [(f"IS_KEY_{i:04d}", f"value {i}") for i in range(2000)]
+    items[10] = (None, "keyless")
+    gmd = Gmd(make_gmd_data(items))
+    assert gmd.key_index.bucket_hash == 2
+    assert gmd.key_index.keys is None
+    check_get_by_key(gmd, items)
+
+
+def test_get_by_key_fallback():
+    gmd = Gmd(make_gmd_data(ITEMS, hashed=False))
+    assert gmd.key_index.bucket_hash is None
+    check_get_by_key(gmd, ITEMS)
+
+
+def test_key_hash():
+    # the hash of an empty key is the JAMCRC of empty input
+    assert key_hash("", 2) == 0xFFFFFFFF
+    assert key_hash("AB", 2) == key_hash("ABAB", 1)
+
+
+def test_key_hash_known_values():
+    # the CRC-32 check value 0xCBF43926 without the final inversion
+    assert key_hash("123456789", 1) == 0x340BC6D9
+    assert key_hash("IS_SKILL_001_NAME", 2) == 0x681B4127
+    assert key_hash("IS_SKILL_001_NAME", 3) == 0xE4A7A279
+    assert key_hash("IS_ITEM_035", 2) == 0xC20841FE
+    assert key_hash("IS_ITEM_040", 3) == 0x00F47122
+
+
+def make_literal_gmd(infos, buckets):
+    """Assemble a GMD of three fixed keys with the given infos and buckets."""
+    keys = b"IS_SKILL_001_NAME\x00IS_ITEM_035\x00IS_ITEM_040\x00"
+    strings = b"Attack Boost\x00Potion\x00Mega Potion\x00"
+    bucket_list = [0] * 256
+    for bucket, index in buckets.items():
+        bucket_list[bucket] = index
+    return bytearray(
+        struct.pack("<10I", Gmd.MAGIC, 0x00010302, 1, 0, 0, 3, 3,
+                    len(keys), len(strings), 4) + b"test\x00"
+        + b"".join(struct.pack("<III4xqq", *it) for it in infos)
+        + struct.pack("<256q", *bucket_list) + keys + strings)
+
+
+LITERAL_VALUES = {
+    "IS_SKILL_001_NAME": "Attack Boost",
+    "IS_ITEM_035": "Potion",
+    "IS_ITEM_040": "Mega Potion",
+}
+
+
+def test_key_index_literal_2x_buckets():
+    # IS_ITEM_035 and IS_ITEM_040 share the 2x bucket 0xFE and are chained
+    gmd = Gmd(make_literal_gmd([
+        # string_index, hash_2x, hash_3x, key_offset, list_index
+        (0, 0x681B4127, 0xE4A7A279, 0, 0),
+        (1, 0xC20841FE, 0x70381E12, 18, 2),
+        (2, 0x18F352FE, 0x00F47122, 30, 0),
+    ], {0x27: 0, 0xFE: 1}))
+    assert gmd.key_index.bucket_hash == 2
+    assert gmd.key_index.keys is None
+    assert {key: gmd.get_by_key(key).value for key in LITERAL_VALUES} \
+        == LITERAL_VALUES
+    assert gmd.get_by_key("IS_ITEM_036") is None
+
+
+def test_key_index_literal_3x_buckets():
+    # the same keys with buckets taken from the 3x hash
+    gmd = Gmd(make_literal_gmd([
+        (0, 0x681B4127, 0xE4A7A279, 0, 0),
+        (1, 0xC20841FE, 0x70381E12, 18, 0),
+        (2, 0x18F352FE, 0x00F47122, 30, 0),
+    ], {0x79: 0, 0x12: 1, 0x22: 2}))
+    assert gmd.key_index.bucket_hash == 3
+    assert gmd.key_index.keys is None
+    assert {key: gmd.get_by_key(key).value for key in LITERAL_VALUES} \
+        == LITERAL_VALUES
+
+
+def test_serialize_round_trip():
+    for items in (ITEMS, ITEMS[:2], [(None, "a")], []):
+        data = make_gmd_data(items)
+        assert Gmd(data).serialize() == data
+
+
+def test_set_string():
+    gmd = Gmd(make_gmd_data(ITEMS))
+    calls = []
+    gmd.modified_cb = calls.append
+    gmd.set_string(1, gmd.get_string(1))
+    assert not gmd.modified
+    gmd.set_string(1, "Ω")
+    gmd.set_string(3, "")
+    assert gmd.modified and calls == [True]
+    assert gmd.get_string(1) == "Ω"
+    items = list(ITEMS)
+    items[1] = (items[1][0], "Ω")
+    items[3] = (items[3][0], "")
+    assert gmd.serialize() == make_gmd_data(items)
+
+
+def test_add_item():
+    gmd = Gmd(make_gmd_data(ITEMS))
+    assert gmd.get_by_key("IS_SKILL_001_NAME").value == "Attack Boost"
+    new_items = [("IS_SKILL_%03d_NAME" % i, "Skill %d" % i)
+                 for i in range(3, 600)] + [(None, "keyless")]
+    for key, value in new_items:
+        gmd.add_item(key, value)
+    assert gmd.get_by_key("IS_SKILL_300_NAME").value == "Skill 300"
+    assert gmd.items[-1].value == "keyless"
+    assert gmd.serialize() == make_gmd_data(ITEMS + new_items)
+    try:
+        gmd.add_item("IS_SKILL_001_NAME", "")
+    except ValueError:
+        pass
+    else:
+        assert False, "duplicate key added"
+
+
+def test_save(tmp_path):
+    path = tmp_path / "test_eng.gmd"
+    path.write_bytes(make_gmd_data(ITEMS))
+    with path.open("rb") as fp:
+        gmd = Gmd.load(fp, use_mmap=True)
+    gmd.set_string(0, "Attack Boost+")
+    gmd.add_item("IS_SKILL_002_EXP", "Élément up.")
+    # the mapped file is about to be truncated
+    gmd.detach()
+    assert gmd.modified and gmd.get_string(0) == "Attack Boost+"
+    with path.open("wb") as fp:
+        gmd.save(fp)
+    assert not gmd.modified
+    assert gmd.get_by_key("IS_SKILL_002_EXP").value == "Élément up."
+    with path.open("rb") as fp:
+        saved = Gmd.load(fp)
+    assert [(it.key, it.value) for it in saved.items] \
+        == [(it.key, it.value) for it in gmd.items]
+    assert saved.get_by_key("IS_SKILL_001_NAME").value == "Attack Boost+"
+
+
+def test_display_strings():
+    items = [("A", "Guard <ICON ALPHA>"), ("B", ""), ("C", "<ICON GAMMA>")]
+    gmd = Gmd(make_gmd_data(items))
+    display = gmd.display_strings
+    assert gmd.display_strings is display
+    assert display.values == [None] * 3
+    assert display[1] == "<blank:1>"
+    assert display.values == [None, "<blank:1>", None]
+    assert [display[i] for i in range(3)] == \
+        ["Guard  α", "<blank:1>", " γ"]
+    gmd.set_string(1, "<ICON BETA>")
+    gmd.add_item("D", "Up")
+    assert [display[i] for i in range(4)] == [
+        "Guard  α", " β", " γ", "Up"]
+    for index in (-1, 4):
+        try:
+            display[index]
+        except IndexError:
+            pass
+        else:
+            assert False, index
+
+
+def test_info_table_rows():
+    items = [(None, "a"), ("KEY_1", "b"), (None, "c"), (None, "d"),
+             ("KEY_2", "e"), (None, "f")]
+    gmd = Gmd(make_gmd_data(items))
+    table = gmd.info_table
+    assert list(table.string_index) == [1, 4]
+    assert len(table) == len(gmd.items) == 6
+    assert [it.key_offset != -1 for it in table] == \
+        [key is not None for key, _ in items]
+    assert [(it.key, it.value) for it in gmd.items] == \
+        [(key or "", value) for key, value in items]
+    row = table[4]
+    assert (row.index, row.string_index, row.pad) == (1, 4, "00 00 00 00")
+    assert row.hash_key_2x & 0xFFFFFFFF == key_hash("KEY_2", 2)
+    assert table[-1] == table[5]
+    assert table[0].index is None and table[0].list_index == 0
@@ -0,0 +1,86 @@
+# coding: utf-8
+import os
+
+from mhw_armor_edit.text_index import TextIndex, tokenize, make_snippet
+from .test_gmd import make_gmd_data
+
+ITEMS_ENG = [
+    ("IS_SKILL_001_NAME", "Attack Boost"),
+    ("IS_SKILL_001_EXP", "Increases attack power."),
+    (None, "Rathalos Mantle"),
+]
+ITEMS_JPN = [
+    ("IS_SKILL_001_NAME", "攻撃"),
+    ("IS_SKILL_001_EXP", "攻撃力が上がる"),
+]
+
+
+def write_gmd(root, rel_path, items):
+    path = os.path.join(str(root), "common", "text", rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(make_gmd_data(items))
+    return os.path.normpath(path)
+
+
+def search(index, query):
+    return [(os.path.basename(it.path), it.string_index, it.key)
+            for it in index.search(query)]
+
+
+def test_tokenize():
+    assert tokenize("Attack Boost+ <ICON ALPHA>") == \
+        ["attack", "boost", "icon", "alpha"]
+
+
+def test_make_snippet():
+    value = "x" * 50 + "Rathalos" + "y" * 50
+    snippet = make_snippet(value, "rathalos")
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert "Rathalos" in snippet
+    assert make_snippet("Attack", "attack") == "Attack"
+
+
+def test_search(tmp_path):
+    chunk = tmp_path / "chunk"
+    mod = tmp_path / "mod"
+    write_gmd(chunk, os.path.join("steam", "skill_eng.gmd"), ITEMS_ENG)
+    write_gmd(chunk, os.path.join("steam", "skill_jpn.gmd"), ITEMS_JPN)
+    index = TextIndex(str(tmp_path / "index.pickle"))
+    assert index.update([str(chunk), str(mod)], max_workers=2) == (2, 0)
+    assert search(index, "attack") == [
+        ("skill_eng.gmd", 0, "IS_SKILL_001_NAME"),
+        ("skill_eng.gmd", 1, "IS_SKILL_001_EXP"),
+    ]
+    assert search(index, "ATTACK pow") == [
+        ("skill_eng.gmd", 1, "IS_SKILL_001_EXP")]
+    assert search(index, "thalo") == [("skill_eng.gmd", 2, "")]
+    assert search(index, "攻撃力") == [
+        ("skill_jpn.gmd", 1, "IS_SKILL_001_EXP")]
+    assert search(index, "attack rathalos") == []
+    assert search(index, "") == []
+    assert index.search("attack", limit=1)[0].snippet == "Attack Boost"
+
+
+def test_update_incremental(tmp_path):
+    chunk = tmp_path / "chunk"
+    eng = write_gmd(chunk, os.path.join("steam", "skill_eng.gmd"), ITEMS_ENG)
+    jpn = write_gmd(chunk, os.path.join("steam", "skill_jpn.gmd"), ITEMS_JPN)
+    index = TextIndex(str(tmp_path / "index.pickle"))
+    index.update([str(chunk)], max_workers=1)
+    assert index.update([str(chunk)], max_workers=1) == (0, 0)
+    write_gmd(chunk, os.path.join("steam", "skill_eng.gmd"),
+              [("IS_SKILL_001_NAME", "Defense Boost")])
+    os.utime(eng, ns=(0, 1))
+    os.unlink(jpn)
+    assert index.update([str(chunk)], max_workers=1) == (1, 1)
+    assert search(index, "attack") == []
+    assert search(index, "defense") == [
+        ("skill_eng.gmd", 0, "IS_SKILL_001_NAME")]
+    assert "攻撃" not in index.postings
+    assert not [it for it in index.trigrams if "攻" in it]
+    index.save()
+    loaded = TextIndex(index.path)
+    loaded.load()
+    assert search(loaded, "defense") == search(index, "defense")
+    assert loaded.update([str(chunk)], max_workers=1) == (0, 0)
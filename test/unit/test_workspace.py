@@ -0,0 +1,498 @@
+# coding: utf-8
+import mmap
+import os
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from mhw_armor_edit.editor import gmd_editor  # registers the GMD plugin
+from mhw_armor_edit.editor.models import (EditorPlugin, FilePluginRegistry,
+                                          RelationCache)
+from mhw_armor_edit import models
+from mhw_armor_edit.models import (Directory, FileWatcher, Workspace,
+                                   WorkspaceFile)
+from mhw_armor_edit.utils import get_t9n
+from .test_ftypes import Sample, fill_sample, make_data
+from .test_gmd import make_gmd_data
+
+
+@pytest.fixture(scope="module", autouse=True)
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+class SamplePlugin(EditorPlugin):
+    pattern = "*.sample"
+    data_factory = Sample
+    relations = {
+        "a.sample": {"t9n": "names_eng.gmd", "rel": "rel.sample"},
+        "b.sample": {"t9n": "names_eng.gmd", "rel": "rel.sample"},
+    }
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return Directory("test", None, str(tmp_path))
+
+
+@pytest.fixture
+def workspace(directory):
+    FilePluginRegistry.relation_cache.clear()
+    workspace = Workspace([directory])
+    yield workspace
+    workspace.cancel_loading()
+    workspace.executor.shutdown()
+    FilePluginRegistry.relation_cache.clear()
+    FilePluginRegistry.lang = "eng"
+
+
+def wait_for(signal, timeout=5000):
+    """Run the event loop until signal is emitted, get its arguments."""
+    loop = QEventLoop()
+    emitted = []
+
+    def handle(*args):
+        emitted.append(args)
+        loop.quit()
+
+    signal.connect(handle)
+    QTimer.singleShot(timeout, loop.quit)
+    try:
+        loop.exec_()
+    finally:
+        signal.disconnect(handle)
+    assert emitted, "timed out"
+    return emitted[0]
+
+
+def wait_until(condition, timeout=5):
+    """Run the event loop until condition is true."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        QApplication.processEvents()
+        time.sleep(0.01)
+
+
+def run_events(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        QApplication.processEvents()
+        time.sleep(0.01)
+
+
+class Reads:
+    """Records the files read by FilePluginRegistry.load_data and the
+    threads reading them, reads wait while gate is cleared."""
+
+    def __init__(self, load_data):
+        self.load_data = load_data
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = []
+
+    def __call__(self, abs_path, use_mmap=False):
+        self.calls.append((os.path.basename(abs_path),
+                           threading.current_thread()))
+        assert self.gate.wait(5)
+        return self.load_data(abs_path, use_mmap)
+
+    @property
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    reads = Reads(FilePluginRegistry.load_data)
+    monkeypatch.setattr(FilePluginRegistry, "load_data", reads)
+    yield reads
+    reads.gate.set()
+
+
+def open_in(workspace, directory, rel_path):
+    abs_path, _ = directory.get_child_path(rel_path)
+    workspace.open_file(directory, abs_path)
+    wait_for(workspace.fileOpened)
+    return workspace.files[os.path.normpath(abs_path)]
+
+
+def write_sample(directory, rel_path, num_entries=10):
+    path, _ = directory.get_child_path(rel_path)
+    with open(path, "wb") as fp:
+        fp.write(make_data(Sample, num_entries, fill_sample))
+
+
+def open_sample(directory, rel_path):
+    ws_file = WorkspaceFile(directory, rel_path)
+    with open(ws_file.abs_path, "rb") as fp:
+        ws_file.set_data(Sample.load(fp))
+    ws_file.mark_synced()
+    return ws_file
+
+
+def read_sample(ws_file):
+    with open(ws_file.abs_path, "rb") as fp:
+        return Sample.load(fp)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX permissions")
+def test_save_atomic_keeps_mode(directory):
+    write_sample(directory, "main.bin")
+    ws_file = open_sample(directory, "main.bin")
+    os.chmod(ws_file.abs_path, 0o640)
+    ws_file.data[1].rarity = 99
+    ws_file.save_atomic()
+    assert stat.S_IMODE(os.stat(ws_file.abs_path).st_mode) == 0o640
+    assert read_sample(ws_file)[1].rarity == 99
+
+
+def test_save_with_relation(directory):
+    write_sample(directory, "main.bin")
+    write_sample(directory, "rel.bin")
+    main = open_sample(directory, "main.bin")
+    rel = open_sample(directory, "rel.bin")
+    main.add_relation("rel", rel)
+    main.data[0].rarity = 50
+    rel.data[1].rarity = 51
+    for ws_file in main.get_files_modified():
+        ws_file.save()
+    assert read_sample(main)[0].rarity == 50
+    assert read_sample(rel)[1].rarity == 51
+    assert not main.data.modified and not rel.data.modified
+
+
+def test_undo_to_saved_state_per_file(directory):
+    write_sample(directory, "main.bin")
+    write_sample(directory, "rel.bin")
+    main = open_sample(directory, "main.bin")
+    rel = open_sample(directory, "rel.bin")
+    main.add_relation("rel", rel)
+    main.data[0].rarity = 50
+    main.save()
+    rel.data[1].rarity = 51
+    main.data[2].rarity = 52
+    main.undo_stack.undo()
+    assert not main.data.modified
+    assert rel.data.modified
+    main.undo_stack.undo()
+    assert not rel.data.modified
+    main.undo_stack.undo()
+    assert main.data.modified and main.data[0].rarity == 0
+
+
+def get_relation(cache, directory, rel_path):
+    path, _ = directory.get_child_path(rel_path)
+    with open(path, "rb") as fp:
+        data = Sample.load(fp)
+    return cache.get(directory, rel_path, WorkspaceFile, data)
+
+
+def test_relation_cache_shares_relations(directory):
+    for rel_path in ("a.bin", "b.bin", "rel.bin", "other.bin"):
+        write_sample(directory, rel_path)
+    cache = RelationCache(max_unused=1)
+    a = open_sample(directory, "a.bin")
+    b = open_sample(directory, "b.bin")
+    rel = get_relation(cache, directory, "rel.bin")
+    a.add_relation("rel", rel)
+    assert get_relation(cache, directory, "rel.bin") is rel
+    b.add_relation("rel", rel)
+    assert rel.dependents == [a, b]
+    a.get_relation_data("rel")[0].rarity = 10
+    assert b.get_relation_data("rel")[0].rarity == 10
+    a.remove_relation("rel")
+    assert rel.dependents == [b]
+    assert rel.undo_stack is b.undo_stack
+    b.remove_relation("rel")
+    assert cache.is_unused(rel)
+    assert get_relation(cache, directory, "rel.bin") is rel
+    # modified, but not used anymore and changed on disk
+    write_sample(directory, "rel.bin", 11)
+    reloaded = get_relation(cache, directory, "rel.bin")
+    assert reloaded is not rel and len(reloaded.data) == 11
+    reloaded.data[0].rarity = 20
+    # of the unused files only the newest is kept, modified or not
+    other = get_relation(cache, directory, "other.bin")
+    get_relation(cache, directory, "a.bin")
+    assert other.abs_path not in cache.files
+    assert reloaded.abs_path not in cache.files
+
+
+def test_shared_relation_undo(directory):
+    for rel_path in ("a.bin", "b.bin", "rel.bin"):
+        write_sample(directory, rel_path)
+    a = open_sample(directory, "a.bin")
+    b = open_sample(directory, "b.bin")
+    rel = open_sample(directory, "rel.bin")
+    a.add_relation("rel", rel)
+    rel.data[0].rarity = 10
+    b.add_relation("rel", rel)
+    rel.data[1].rarity = 11
+    assert b.undo_stack.count() == 0
+    a.undo_stack.undo()
+    assert rel.data[0].rarity == 10 and rel.data[1].rarity == 1
+    a.undo_stack.undo()
+    assert rel.data[0].rarity == 0
+    assert not rel.data.modified
+    a.undo_stack.redo()
+    a.remove_relation("rel")
+    rel.data[1].rarity = 11
+    # not the newest step of the relation anymore
+    a.undo_stack.undo()
+    assert rel.data[0].rarity == 10 and rel.data[1].rarity == 11
+    b.undo_stack.undo()
+    assert rel.data[1].rarity == 1
+
+
+def test_reload_relation_keeps_dependent_edits(directory):
+    write_sample(directory, "main.bin")
+    write_sample(directory, "rel.bin")
+    main = open_sample(directory, "main.bin")
+    rel = open_sample(directory, "rel.bin")
+    main.add_relation("rel", rel)
+    rel.data[1].rarity = 11
+    main.data[0].rarity = 10
+    write_sample(directory, "rel.bin", 11)
+    with open(rel.abs_path, "rb") as fp:
+        rel.set_data(Sample.load(fp))
+    rel.mark_synced()
+    assert main.data.modified and main.undo_stack.count() == 2
+    main.save()
+    assert read_sample(main)[0].rarity == 10
+    main.undo_stack.undo()
+    assert main.data[0].rarity == 0
+    # the relation's command is obsolete with its data reloaded
+    main.undo_stack.undo()
+    assert main.undo_stack.count() == 1 and len(rel.data) == 11
+    assert not rel.data.modified
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX permissions")
+def test_save_atomic_new_file_mode(directory):
+    write_sample(directory, "main.bin")
+    ws_file = open_sample(directory, "main.bin")
+    os.unlink(ws_file.abs_path)
+    ws_file.save_atomic()
+    assert stat.S_IMODE(os.stat(ws_file.abs_path).st_mode) \
+        == 0o666 & ~models.UMASK
+
+
+def test_only_gmd_relations_are_mapped(tmp_path):
+    chunk = Directory("chunk", None, str(tmp_path), use_mmap=True)
+    mod = Directory("mod", None, str(tmp_path))
+    (tmp_path / "item_eng.gmd").write_bytes(make_gmd_data(
+        [("ITEM_000", "Potion")]))
+    write_sample(chunk, "main.bin")
+
+    def load(directory, rel_path, is_relation):
+        ws_file = WorkspaceFile(directory, rel_path)
+        FilePluginRegistry.load_model(ws_file, is_relation)
+        return isinstance(ws_file.data.data, mmap.mmap)
+
+    assert load(chunk, "item_eng.gmd", True)
+    assert not load(chunk, "item_eng.gmd", False)
+    assert not load(mod, "item_eng.gmd", True)
+    assert not FilePluginRegistry.can_map(
+        chunk, os.path.join(str(tmp_path), "main.bin"), True)
+
+
+def test_switch_language(workspace, directory, tmp_path):
+    for rel_path in ("a.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    for lang, name in (("eng", "Potion"), ("fre", "Potion (fr)")):
+        (tmp_path / f"names_{lang}.gmd").write_bytes(make_gmd_data(
+            [("ITEM_000", name)]))
+    a = open_in(workspace, directory, "a.sample")
+    eng = a.relations["t9n"]
+    assert get_t9n(a, "t9n", 0) == "Potion"
+    reloaded = []
+    a.reloaded.connect(lambda: reloaded.append(True))
+    FilePluginRegistry.lang = "fre"
+    workspace.reload_translations()
+    assert reloaded
+    assert get_t9n(a, "t9n", 0) == "Potion (fr)"
+    assert a.relations["t9n"].rel_path == "names_fre.gmd"
+    assert eng.dependents == []
+    # only translations are switched
+    assert a.relations["rel"].dependents == [a]
+    FilePluginRegistry.lang = "eng"
+    workspace.reload_translations()
+    assert a.relations["t9n"] is eng
+    assert get_t9n(a, "t9n", 0) == "Potion"
+    # a cached translation changed on disk while unused is reloaded
+    FilePluginRegistry.lang = "fre"
+    workspace.reload_translations()
+    (tmp_path / "names_eng.gmd").write_bytes(make_gmd_data(
+        [("ITEM_000", "Potion+")]))
+    FilePluginRegistry.lang = "eng"
+    workspace.reload_translations()
+    assert a.relations["t9n"] is not eng
+    assert get_t9n(a, "t9n", 0) == "Potion+"
+
+
+def test_close_drops_relation_edits(workspace, directory, tmp_path):
+    for rel_path in ("a.sample", "b.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    a = open_in(workspace, directory, "a.sample")
+    b = open_in(workspace, directory, "b.sample")
+    rel = a.relations["rel"]
+    assert b.relations["rel"] is rel
+    rel.data[0].rarity = 10
+    workspace.close_file(a)
+    # still used by b
+    assert b.get_relation_data("rel")[0].rarity == 10
+    workspace.close_file(b)
+    assert rel.abs_path not in FilePluginRegistry.relation_cache.files
+    a = open_in(workspace, directory, "a.sample")
+    assert a.relations["rel"] is not rel
+    assert not a.relations["rel"].data.modified
+    assert a.get_relation_data("rel")[0].rarity == 0
+    assert [it.abs_path for it in a.get_files_modified()] == [a.abs_path]
+
+
+def test_open_files_sharing_relation(workspace, directory, reads):
+    for rel_path in ("a.sample", "b.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    opened = []
+    workspace.fileOpened.connect(lambda path, rel_path: opened.append(path))
+    reads.gate.clear()
+    for rel_path in ("a.sample", "b.sample"):
+        workspace.open_file(directory, directory.get_child_path(rel_path)[0])
+    reads.gate.set()
+    wait_until(lambda: not workspace.is_loading)
+    assert sorted(opened) == sorted(workspace.files)
+    a, b = (workspace.files[it] for it in sorted(opened))
+    assert a.relations["rel"] is b.relations["rel"]
+    assert a.relations["rel"].dependents == [a, b]
+    assert sorted(reads.names) == ["a.sample", "b.sample", "rel.sample"]
+    assert workspace.pending == {}
+
+
+def test_cancel_loading(workspace, directory, reads):
+    for rel_path in ("a.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    events = []
+    workspace.fileOpened.connect(lambda *args: events.append(args))
+    workspace.fileLoadError.connect(lambda *args: events.append(args))
+    progress = []
+    workspace.loadProgress.connect(lambda *args: progress.append(args))
+    reads.gate.clear()
+    workspace.open_file(directory, directory.get_child_path("a.sample")[0])
+    futures = list(workspace.pending.values())
+    assert workspace.is_loading and progress == [(0, 2)]
+    workspace.cancel_loading()
+    assert not workspace.is_loading and progress[-1] == (0, 0)
+    reads.gate.set()
+    wait_until(lambda: all(it.done() for it in futures))
+    QApplication.processEvents()
+    assert events == [] and workspace.files == {}
+    a = open_in(workspace, directory, "a.sample")
+    assert a.relations["rel"].dependents == [a]
+
+
+def test_load_error_in_worker(workspace, directory, reads):
+    write_sample(directory, "a.sample")
+    path, _ = directory.get_child_path("rel.sample")
+    with open(path, "wb") as fp:
+        fp.write(b"\x00" * 4)
+    workspace.open_file(directory, directory.get_child_path("a.sample")[0])
+    abs_path, rel_path, error = wait_for(workspace.fileLoadError)
+    assert rel_path == "a.sample" and "too small" in error
+    assert not workspace.is_loading and workspace.files == {}
+    assert workspace.pending == {}
+    assert all(thread is not threading.main_thread()
+               for _, thread in reads.calls)
+
+
+def test_relation_evicted_while_loading(workspace, directory, reads):
+    for rel_path in ("a.sample", "b.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    a = open_in(workspace, directory, "a.sample")
+    rel = a.relations["rel"]
+    workspace.close_file(a)
+    reads.calls.clear()
+    reads.gate.clear()
+    workspace.open_file(directory, directory.get_child_path("b.sample")[0])
+    # the cached relation isn't read again
+    assert [os.path.basename(path) for path, _ in workspace.pending] \
+        == ["b.sample"]
+    FilePluginRegistry.relation_cache.clear()
+    reads.gate.set()
+    wait_until(lambda: not workspace.is_loading)
+    b = workspace.files[os.path.normpath(
+        directory.get_child_path("b.sample")[0])]
+    assert b.relations["rel"] is not rel
+    assert reads.names == ["b.sample", "rel.sample"]
+    assert all(thread is not threading.main_thread()
+               for _, thread in reads.calls)
+
+
+def test_watcher_file_changed(tmp_path):
+    path = str(tmp_path / "a.bin")
+    with open(path, "wb") as fp:
+        fp.write(b"a")
+    watcher = FileWatcher()
+    watcher.set_paths([path])
+    assert path in watcher.watcher.files() and not watcher.polled
+    with open(path, "ab") as fp:
+        fp.write(b"b")
+    assert wait_for(watcher.fileChanged) == (path,)
+    # replaced atomically, like save_atomic does
+    with open(path + ".tmp", "wb") as fp:
+        fp.write(b"abc")
+    os.replace(path + ".tmp", path)
+    assert wait_for(watcher.fileChanged) == (path,)
+    assert path in watcher.watcher.files()
+    with open(path, "ab") as fp:
+        fp.write(b"d")
+    assert wait_for(watcher.fileChanged) == (path,)
+    watcher.set_paths([])
+    assert not watcher.watcher.files() and not watcher.stats
+
+
+def test_watcher_polls_missing_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileWatcher, "POLL_INTERVAL", 50)
+    path = str(tmp_path / "a.bin")
+    watcher = FileWatcher()
+    watcher.set_paths([path])
+    assert watcher.polled == {path} and watcher.poll_timer.isActive()
+    with open(path, "wb") as fp:
+        fp.write(b"a")
+    assert wait_for(watcher.fileChanged) == (path,)
+    # watched again once it exists
+    assert path in watcher.watcher.files() and not watcher.polled
+    assert not watcher.poll_timer.isActive()
+
+
+def test_own_saves_no_conflict(workspace, directory, tmp_path):
+    for rel_path in ("a.sample", "rel.sample"):
+        write_sample(directory, rel_path)
+    (tmp_path / "names_eng.gmd").write_bytes(make_gmd_data(
+        [("ITEM_000", "Potion")]))
+    a = open_in(workspace, directory, "a.sample")
+    conflicts = []
+    workspace.fileConflict.connect(lambda *args: conflicts.append(args))
+    data = a.data
+    a.data[0].rarity = 10
+    a.relations["rel"].data[0].rarity = 11
+    for ws_file in a.get_files_modified():
+        ws_file.save()
+    # GMDs are replaced on save
+    a.relations["t9n"].data.set_string(0, "Mega Potion")
+    a.relations["t9n"].save()
+    a.data[2].rarity = 13
+    run_events(FileWatcher.SETTLE_DELAY * 3 / 1000)
+    assert conflicts == [] and a.data is data and a.data.modified
+    # changed by another tool with unsaved edits
+    write_sample(directory, "a.sample", 11)
+    assert wait_for(workspace.fileConflict)[1] == "a.sample"
+    assert a.data is data